@@ -1,11 +1,21 @@
 import flask
-from flask import jsonify, Response, send_from_directory, request
+from flask import jsonify, Response, send_from_directory, request, url_for, current_app
 from apidoc import spec
 from schemas import ApiInfoSchema, CorpusSchema
-from sparql import DB
-from corpora import Corpora
+from sparql import DB, QueryCache, ChangeCounter
+from corpora import Corpora, CorporaLoader
+from compression import ResponseCompressor, PayloadCache
+from snapshot import SnapshotFile
+from ingest import ChunkedIngest
+from jobs import IngestQueue, QueueFullError
+from datetime import datetime
 import os
+import sys
+import atexit
 import json
+import base64
+import hashlib
+import tempfile
 
 service_version = "0.1.0"
 """SERVICE_VERSION: Version of the service.
@@ -56,48 +66,330 @@ triplestore_pwd = os.environ.get("CONN_PASSWORD", "admin")
 """CONN_PASSWORD: User name to use to connect to Triplestore
 """
 
+triplestore_pool_size = int(os.environ.get("CONN_POOL_SIZE", 10))
+"""CONN_POOL_SIZE: Maximum number of keep-alive connections to the Triple Store.
+Queries, uploads and deletes share this connection pool.
+"""
+
+triplestore_max_in_flight = int(os.environ.get("CONN_MAX_IN_FLIGHT", triplestore_pool_size))
+"""CONN_MAX_IN_FLIGHT: Maximum number of concurrent requests to the Triple Store.
+Requests of further threads wait until a slot is free. Defaults to (and is at most) CONN_POOL_SIZE.
+"""
+
+triplestore_pool_timeout = float(os.environ.get("CONN_POOL_TIMEOUT", 30))
+"""CONN_POOL_TIMEOUT: Seconds a request waits for a free connection to the Triple Store before it fails.
+"""
+
 # this is probably not in use
 # triplestore_graph = os.environ.get("CONN_GRAPH", "https://golemlab.eu/data")
 """CONN_GRAPH: Default named graph where data is stored
 """
 
-# Establish a connection to the Triple Store with the designated class "DB"
-# TODO: test, if the connection was successfully established. Although, the __init__ will raise an error
-# removed graph=triplestore_graph
-db = DB(
-    triplestore=triplestore_name,
-    protocol=triplestore_protocol,
-    url=triplestore_url,
-    port=str(triplestore_port),
-    username=triplestore_user,
-    password=triplestore_pwd
-)
-
-
-# Setup of the corpora
-# Need to instantiate the corpora here!
-# TODO fix this
-corpora = Corpora(database=db)
-# load the corpora
-try:
-    corpora.load()
-except:
-    # raise Exception("Can not load corpora. SPARQL endpoint is " + db.sparql_query_endpoint)
-    pass
-
-# Setup of flask API
-api = flask.Flask(__name__)
-# enable UTF-8 support
-api.config["JSON_AS_ASCII"] = False
-
-
-@api.route("/", methods=["GET"])
+# Caching and loading of the data
+
+cache_size = int(os.environ.get("CACHE_SIZE", 64))
+"""CACHE_SIZE: Memory budget of the cache of SPARQL query results in MB.
+Least recently used results are evicted. 0 disables the cache.
+"""
+
+cache_ttl = float(os.environ.get("CACHE_TTL", 300))
+"""CACHE_TTL: Default time to live of cached SPARQL query results in seconds.
+"""
+
+cache_ttls = json.loads(os.environ.get("CACHE_TTLS", "{}"))
+"""CACHE_TTLS: Time to live in seconds by name of the query class as JSON,
+e.g. {"CorpusCharactersUriIdName": 3600}. Overrides CACHE_TTL.
+"""
+
+corpora_refresh_interval = float(os.environ.get("CORPORA_REFRESH_INTERVAL", 0))
+"""CORPORA_REFRESH_INTERVAL: Interval in seconds to reload the corpora in the background.
+0 disables the periodic refresh.
+"""
+
+corpora_warmup = os.environ.get("CORPORA_WARMUP", "background")
+"""CORPORA_WARMUP: When the corpora are loaded after the app has been created (see create_app()):
+"wait" loads them before the app is returned, "background" starts loading them in a thread and "lazy" loads them
+with the first request that needs them. Requests wait for a load that is still running. Defaults to "background".
+"""
+
+corpora_snapshot = os.environ.get("CORPORA_SNAPSHOT", "")
+"""CORPORA_SNAPSHOT: Path of a file to store the loaded corpora on disk (see module "snapshot"), e.g. on a volume.
+When the service starts, the corpora are restored from this file and served right away, while they are loaded from
+the Triple Store in the background to check that the snapshot is current. Empty (default) disables the snapshot.
+"""
+
+streaming_mimetypes = ["application/json", "application/x-ndjson"]
+"""Formats of streamed listings (see stream_items()), negotiated with the Accept header. The first is the default.
+"""
+
+characters_page_size = int(os.environ.get("CHARACTERS_PAGE_SIZE", 100))
+"""CHARACTERS_PAGE_SIZE: Default number of characters per page of the endpoint /corpora/{corpus_id}/characters,
+if a page is requested with "offset" or "cursor" but without "limit".
+"""
+
+characters_max_page_size = int(os.environ.get("CHARACTERS_MAX_PAGE_SIZE", 1000))
+"""CHARACTERS_MAX_PAGE_SIZE: Maximum value of the parameter "limit" of the endpoint /corpora/{corpus_id}/characters.
+"""
+
+ingest_chunk_size = int(os.environ.get("INGEST_CHUNK_SIZE", 50000))
+"""INGEST_CHUNK_SIZE: Maximum number of statements per chunk, when N-Triples or N-Quads are loaded with POST /db.
+"""
+
+ingest_validation = os.environ.get("INGEST_VALIDATION", "syntax")
+"""INGEST_VALIDATION: Default validation of N-Triples and N-Quads loaded with POST /db: "syntax" (fast check of each
+line), "rdflib" (parse with rdflib) or "none". See ChunkedIngest.
+"""
+
+ingest_allow_unvalidated = os.environ.get("INGEST_ALLOW_UNVALIDATED", "FALSE") == "TRUE"
+"""INGEST_ALLOW_UNVALIDATED: Allow clients to load data without validation (parameter "validation" set to "none" of
+POST /db). Only enable it, if all clients that can reach the service are trusted.
+"""
+
+ingest_workers = int(os.environ.get("INGEST_WORKERS", 1))
+"""INGEST_WORKERS: Number of uploads that are loaded into the Triple Store at the same time per worker process of the
+service, i.e. up to INGEST_WORKERS * SERVICE_WORKERS uploads in total. Further uploads wait in a queue.
+"""
+
+ingest_max_queued = int(os.environ.get("INGEST_MAX_QUEUED", 10))
+"""INGEST_MAX_QUEUED: Maximum number of uploads that wait to be loaded per worker process, i.e. up to
+INGEST_MAX_QUEUED * SERVICE_WORKERS uploads in total (and on disk in INGEST_SPOOL_DIR). Further uploads are rejected
+with status 503.
+"""
+
+ingest_spool_dir = os.environ.get("INGEST_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "golem-ingest"))
+"""INGEST_SPOOL_DIR: Directory where uploaded data and the status of the ingest jobs are stored until the data is
+loaded. Must be writable and, to query the status of a job from any worker process, shared by the workers.
+Defaults to the directory "golem-ingest" in the temporary directory of the system.
+"""
+
+changes_file = os.environ.get("CHANGES_FILE", os.path.join(ingest_spool_dir, "changes"))
+"""CHANGES_FILE: File with a counter of the changes of the data, shared by the worker processes of the service (see
+ChangeCounter). After a worker has loaded or deleted data, the other workers invalidate their cached query results and
+corpora with their next request. Must be writable and shared by all workers (and all instances of the service that
+use the same Triple Store). Defaults to the file "changes" in INGEST_SPOOL_DIR. Empty disables it, which is only safe
+with a single worker process.
+"""
+
+ingest_processes = int(os.environ.get("INGEST_PROCESSES", 1))
+"""INGEST_PROCESSES: Number of processes that parse the chunks of an upload. Set it to the number of CPUs to load
+large files faster. If it is greater than 1, uploaded Turtle is split into chunks as well. Data is not split after
+the first blank node label, so that each blank node stays a single node (see ChunkedIngest).
+"""
+
+ingest_uploads = int(os.environ.get("INGEST_UPLOADS", 1))
+"""INGEST_UPLOADS: Number of chunks of an upload that are sent to the Triple Store at the same time. They share the
+connection pool (CONN_POOL_SIZE) with the other requests.
+"""
+
+ingest_formats = {"application/n-triples": "nt", "application/n-quads": "nq"}
+"""Media types of the request body of POST /db that are read line by line and uploaded in chunks (see module
+"ingest"). Other data is parsed as a whole.
+"""
+
+compression_min_size = int(os.environ.get("COMPRESSION_MIN_SIZE", 1024))
+"""COMPRESSION_MIN_SIZE: Minimum size in bytes of a response to be compressed (gzip or, if the package brotli is
+installed, brotli). Streamed listings are always compressed, if the client accepts it.
+"""
+
+compression_level = int(os.environ.get("COMPRESSION_LEVEL", 6))
+"""COMPRESSION_LEVEL: Compression level of gzip (1-9).
+"""
+
+compression_cache_size = int(os.environ.get("COMPRESSION_CACHE_SIZE", 16))
+"""COMPRESSION_CACHE_SIZE: Memory budget of the cache of compressed responses in MB. Responses with an ETag are
+compressed once per version of the data. 0 disables the cache.
+"""
+
+def get_db() -> DB:
+    """Get the connection to the Triple Store of the current app, see create_app()."""
+    return current_app.extensions["golem"]["db"]
+
+
+def get_loader() -> CorporaLoader:
+    """Get the loader of the corpora of the current app, see create_app()."""
+    return current_app.extensions["golem"]["loader"]
+
+
+def get_jobs() -> IngestQueue:
+    """Get the queue of ingest jobs of the current app, see create_app()."""
+    return current_app.extensions["golem"]["jobs"]
+
+
+def get_compressor() -> ResponseCompressor:
+    """Get the compressor of the responses of the current app, see create_app()."""
+    return current_app.extensions["golem"]["compressor"]
+
+
+def get_loaded_corpora() -> Corpora:
+    """Get the current snapshot of the corpora.
+
+    If no corpora have been loaded yet, they are loaded first.
+    Endpoints should get the snapshot once per request and use it throughout.
+    """
+    loader = get_loader()
+    if not loader.corpora.corpora:
+        loader.load(wait=True)
+    return loader.corpora
+
+
+def stream_items(items: list) -> Response:
+    """Stream a listing as response, serializing it row by row.
+
+    The format is negotiated with the Accept header: NDJSON (one JSON document per line) for
+    "application/x-ndjson", otherwise a JSON array that is written incrementally.
+
+    Only the serialization is streamed: the items must have been queried before, so that no connection to the
+    Triple Store is held while a (slow) client reads the response and errors are reported before the status is sent.
+
+    Args:
+        items (list): The items, e.g. the simplified results of a query.
+    """
+    mimetype = request.accept_mimetypes.best_match(streaming_mimetypes, default="application/json")
+    # the items are serialized after the request has been handled, outside of the app context
+    dumps = current_app.json.dumps
+
+    if mimetype == "application/json":
+        def generate():
+            separator = "["
+            for item in items:
+                yield separator + dumps(item)
+                separator = ","
+            yield "[]" if separator == "[" else "]"
+    else:
+        def generate():
+            for item in items:
+                yield dumps(item) + "\n"
+
+    response = Response(generate(), mimetype=mimetype)
+    # the format depends on the Accept header: shared caches must not serve it to clients that accept another one
+    response.vary.add("Accept")
+    return response
+
+
+def get_etag(version, representation: list = None) -> str:
+    """Compute a strong ETag from the version of the data and the parameters that change the representation.
+
+    The version must be derived from state that all worker processes share (see Corpora.get_version()), so that
+    every worker computes the same ETag for the same data.
+
+    Args:
+        version: Version of the data, e.g. of Corpora.get_version(). Must be serializable as JSON.
+        representation (list, optional): Everything else the response depends on, e.g. the query parameters.
+    """
+    data = json.dumps([version, representation])
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+def get_representation(mimetypes: list = None) -> list:
+    """Get the parameters of the current request, that change the representation of a resource.
+
+    Args:
+        mimetypes (list, optional): Formats of the response, that are negotiated with the Accept header.
+    """
+    representation = sorted(request.args.items(multi=True))
+    if mimetypes:
+        representation.append(request.accept_mimetypes.best_match(mimetypes, default=mimetypes[0]))
+    return representation
+
+
+def not_modified(etag: str, modified: datetime = None, vary: list = None):
+    """Get the response "304 Not Modified", if the client already has the current version of a resource.
+
+    Evaluates If-None-Match or, if there is none, If-Modified-Since. Is called before the response is built, no
+    data needs to be queried.
+
+    Args:
+        etag (str): ETag of the current version, see get_etag().
+        modified (datetime, optional): Time of the last change.
+        vary (list, optional): Request headers the representation depends on, e.g. "Accept" (see stream_items()).
+
+    Returns:
+        Response: Empty response with status 304 or None, if the resource needs to be sent.
+    """
+    # the ETag of a compressed response has the encoding as suffix
+    matched_etag = None
+    if request.if_none_match:
+        for representation_etag in get_compressor().etags(etag):
+            if request.if_none_match.contains(representation_etag):
+                matched_etag = representation_etag
+                break
+    elif request.if_modified_since and modified:
+        if modified.replace(microsecond=0) <= request.if_modified_since:
+            matched_etag = etag
+
+    if matched_etag:
+        response = set_validators(Response(status=304), matched_etag, modified)
+        # the same as the full response, which is compressed (see ResponseCompressor)
+        response.vary.add("Accept-Encoding")
+        if vary:
+            response.vary.update(vary)
+        return response
+    else:
+        return None
+
+
+def prepared_response(etag: str, modified: datetime = None, vary: list = None):
+    """Get a response without building it: "304 Not Modified" (see not_modified()) or a cached compressed response.
+
+    Args:
+        etag (str): ETag of the current version, see get_etag().
+        modified (datetime, optional): Time of the last change.
+        vary (list, optional): Request headers the representation depends on, e.g. "Accept" (see stream_items()).
+
+    Returns:
+        Response: Response or None, if the response needs to be built.
+    """
+    response = not_modified(etag, modified, vary=vary)
+    if response is None:
+        response = get_compressor().cached_response(request, etag)
+        if response is not None:
+            if modified:
+                response.last_modified = modified.replace(microsecond=0)
+            if vary:
+                response.vary.update(vary)
+    return response
+
+
+def set_validators(response: Response, etag: str, modified: datetime = None) -> Response:
+    """Set the headers ETag and Last-Modified of a response."""
+    response.set_etag(etag)
+    if modified:
+        response.last_modified = modified.replace(microsecond=0)
+    return response
+
+
+def encode_cursor(last: tuple) -> str:
+    """Encode ID and URI of the last item of a page as opaque cursor to request the next page."""
+    return base64.urlsafe_b64encode(json.dumps(list(last)).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Decode a cursor (see encode_cursor()).
+
+    Raises:
+        ValueError: The cursor is invalid.
+    """
+    try:
+        last = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+    except Exception:
+        raise ValueError("Invalid cursor.")
+
+    if not isinstance(last, list) or len(last) != 2 or not all(isinstance(value, str) for value in last):
+        raise ValueError("Invalid cursor.")
+
+    return tuple(last)
+
+# Endpoints of the API; registered with the flask app in create_app()
+routes = flask.Blueprint("api", __name__)
+
+
+@routes.route("/", methods=["GET"])
 def swagger_ui():
     """Displays the OpenAPI Documentation of the API"""
     return send_from_directory("static/swagger-ui", "index.html")
 
 
-@api.route("/info", methods=["GET"])
+@routes.route("/info", methods=["GET"])
 def get_info():
     """Information about the API
 
@@ -128,7 +420,7 @@ def get_info():
     return jsonify(schema.dump(data))
 
 
-@api.route("/corpora", methods=["GET"])
+@routes.route("/corpora", methods=["GET"])
 def get_corpora():
     """Lists available corpora
 
@@ -149,12 +441,18 @@ def get_corpora():
                         - metrics
         responses:
             200:
-                description: Available corpora.
+                description: Available corpora. Streamed as JSON array or, if requested with the Accept header, as
+                    NDJSON (one corpus per line).
                 content:
                     application/json:
                         schema:
                             type: array
                             items: CorpusSchema
+                    application/x-ndjson:
+                        schema: CorpusSchema
+            304:
+                description: Not modified. The ETag in ``If-None-Match`` (or the date in ``If-Modified-Since``)
+                    matches the current version of the data.
             400:
                 description: Invalid value of parameter "include".
                 content:
@@ -162,33 +460,33 @@ def get_corpora():
                         schema:
                             type: string
     """
-    if not corpora.corpora:
-        try:
-            corpora.load()
-        except:
-            pass
-
     if "include" in request.args:
         param_include = str(request.args["include"])
     else:
         param_include = None
 
-    if param_include:
-        if param_include == "metrics":
-            response_data = corpora.list_corpora(include_metrics=True)
-        else:
-            response_data = None
-            return Response(f"{str(request.args['include'])} is not a valid value of parameter 'include'.", status=400,
-                            mimetype="text/plain")
-    else:
-        response_data = corpora.list_corpora()
+    # validate the parameters before the conditional request is evaluated: an invalid request never gets a 304
+    if param_include and param_include != "metrics":
+        return Response(f"{str(request.args['include'])} is not a valid value of parameter 'include'.", status=400,
+                        mimetype="text/plain")
+
+    corpora = get_loaded_corpora()
+
+    version, modified = corpora.get_version()
+    etag = get_etag(version, get_representation(streaming_mimetypes))
+    response = prepared_response(etag, modified, vary=["Accept"])
+    if response:
+        return response
+
+    # the metadata of corpora that have been reset is queried before the response is sent
+    response_data = corpora.list_corpora(include_metrics=param_include == "metrics")
 
     # TODO: validate against response schema
 
-    return jsonify(response_data)
+    return set_validators(stream_items(response_data), etag, modified)
 
 
-@api.route("/corpora/<path:corpus_id>", methods=["GET"])
+@routes.route("/corpora/<path:corpus_id>", methods=["GET"])
 def get_corpus_metadata(corpus_id: str):
     """Get Metadata on a single corpus
 
@@ -223,6 +521,9 @@ def get_corpus_metadata(corpus_id: str):
                 content:
                     application/json:
                         schema: CorpusMetadata
+            304:
+                description: Not modified. The ETag in ``If-None-Match`` (or the date in ``If-Modified-Since``)
+                    matches the current version of the data.
             400:
                 description: Invalid value of parameter "include".
                 content:
@@ -237,13 +538,16 @@ def get_corpus_metadata(corpus_id: str):
                         schema:
                             type: string
     """
-    if not corpora.corpora:
-        try:
-            corpora.load()
-        except:
-            pass
+    corpora = get_loaded_corpora()
 
     if corpus_id in corpora.corpora:
+        corpus = corpora.corpora[corpus_id]
+
+        version, modified = corpora.get_version()
+        etag = get_etag([version, corpus_id], get_representation())
+        response = prepared_response(etag, corpus.modified)
+        if response:
+            return response
 
         if "include" in request.args:
             param_include = str(request.args["include"])
@@ -268,13 +572,13 @@ def get_corpus_metadata(corpus_id: str):
         # schema.load(metadata)
 
         # return jsonify(schema.dump(metadata))
-        return jsonify(metadata)
+        return set_validators(jsonify(metadata), etag, corpus.modified)
 
     else:
         return Response(f"No such corpus: {corpus_id}", status=404,
                         mimetype="text/plain")
 
-@api.route("/corpora/<path:corpus_id>/characters", methods=["GET"])
+@routes.route("/corpora/<path:corpus_id>/characters", methods=["GET"])
 def get_corpus_characters(corpus_id: str):
     """Get Characters of a single corpus
 
@@ -284,7 +588,11 @@ def get_corpus_characters(corpus_id: str):
     ---
     get:
         summary: Corpus Characters
-        description: Returns characters in a corpus
+        description: Returns characters in a corpus. If one of the parameters ``limit``, ``offset`` or ``cursor`` is
+            set, a single page of the characters (ordered by ID) is returned. The total number of characters is
+            returned in the header ``X-Total-Count``, the cursor of the next page in the header ``X-Next-Cursor``
+            (and as link in the header ``Link``). The characters are streamed as JSON array or, if requested with
+            the Accept header, as NDJSON (one character per line).
         operationId: get_corpus_characters
         parameters:
             -   in: path
@@ -294,12 +602,53 @@ def get_corpus_characters(corpus_id: str):
                 example: potter_corpus
                 schema:
                     type: string
+            -   in: query
+                name: limit
+                description: Maximum number of characters in the page.
+                required: false
+                schema:
+                    type: integer
+                    minimum: 1
+            -   in: query
+                name: offset
+                description: Number of characters to skip. Can not be combined with ``cursor``.
+                required: false
+                schema:
+                    type: integer
+                    minimum: 0
+            -   in: query
+                name: cursor
+                description: Cursor of the next page, see header ``X-Next-Cursor`` of the previous page.
+                required: false
+                schema:
+                    type: string
         responses:
             200:
                 description: Corpus metadata.
+                headers:
+                    X-Total-Count:
+                        description: Total number of characters (only if a page is requested).
+                        schema:
+                            type: integer
+                    X-Next-Cursor:
+                        description: Cursor of the next page (only if a page is requested and there might be more
+                            characters).
+                        schema:
+                            type: string
                 content:
                     application/json:
                         schema: CorpusMetadata
+                    application/x-ndjson:
+                        schema: CharacterSchema
+            304:
+                description: Not modified. The ETag in ``If-None-Match`` (or the date in ``If-Modified-Since``)
+                    matches the current version of the data.
+            400:
+                description: Invalid value of parameter ``limit``, ``offset`` or ``cursor``.
+                content:
+                    text/plain:
+                        schema:
+                            type: string
             404:
                 description: No such corpus. Parameter ``corpus_id`` is invalid. A list of valid values can be
                     retrieved via the ``/corpora`` endpoint.
@@ -308,45 +657,104 @@ def get_corpus_characters(corpus_id: str):
                         schema:
                             type: string
     """
-    if not corpora.corpora:
-        try:
-            corpora.load()
-        except:
-            pass
+    corpora = get_loaded_corpora()
 
     if corpus_id in corpora.corpora:
-        # this will be very basic information
-        characters = corpora.corpora[corpus_id].get_characters()
+        corpus = corpora.corpora[corpus_id]
 
-        return jsonify(characters)
+        # validate the parameters before the conditional request is evaluated: an invalid request never gets a 304
+        paged = any(param in request.args for param in ["limit", "offset", "cursor"])
+        if paged:
+            if "offset" in request.args and "cursor" in request.args:
+                return Response("Parameters 'offset' and 'cursor' can not be combined.", status=400,
+                                mimetype="text/plain")
+
+            try:
+                limit = int(request.args.get("limit", characters_page_size))
+                offset = int(request.args.get("offset", 0))
+                if "cursor" in request.args:
+                    after = decode_cursor(str(request.args["cursor"]))
+                else:
+                    after = None
+            except ValueError:
+                return Response("Invalid value of parameter 'limit', 'offset' or 'cursor'.", status=400,
+                                mimetype="text/plain")
+
+            if limit < 1 or limit > characters_max_page_size or offset < 0:
+                return Response(f"Parameter 'limit' must be between 1 and {characters_max_page_size}, 'offset' must "
+                                f"not be negative.", status=400, mimetype="text/plain")
+
+        version, modified = corpora.get_version()
+        etag = get_etag([version, corpus_id, "characters"], get_representation(streaming_mimetypes))
+        response = prepared_response(etag, corpus.modified, vary=["Accept"])
+        if response:
+            return response
+
+        if not paged:
+            # this will be very basic information; the characters are queried first, only the serialization is
+            # streamed to the client
+            characters = corpus.get_characters()
+
+            return set_validators(stream_items(characters), etag, corpus.modified)
+
+        # a single page of the characters
+        page = corpus.get_characters_page(limit, offset=offset, after=after)
+
+        response = set_validators(stream_items(page["characters"]), etag, corpus.modified)
+        response.headers["X-Total-Count"] = str(page["total"])
+        if page["last"]:
+            cursor = encode_cursor(page["last"])
+            response.headers["X-Next-Cursor"] = cursor
+            next_url = url_for(".get_corpus_characters", corpus_id=corpus_id, limit=limit, cursor=cursor)
+            response.headers["Link"] = f'<{next_url}>; rel="next"'
+
+        return response
 
     else:
         return Response(f"No such corpus: {corpus_id}", status=404,
                         mimetype="text/plain")
 
 
-@api.route("/corpora", methods=["PUT"])
+@routes.route("/corpora", methods=["PUT"])
 def trigger_loading_corpora():
     """Trigger Loading of Corpora
     ---
     put:
             summary: Load Corpora
-            description: Trigger Loading of Corpora
+            description: Trigger loading of corpora in the background. The current corpora are served until the
+                loading is finished and are then replaced as a whole. Use the endpoint ``/corpora/loading``
+                to get the status.
             operationId: trigger_loading_corpora
+            responses:
+                202:
+                    description: Loading of corpora has been started (or is already running).
+                    content:
+                        application/json:
+                            schema: LoadingStatusSchema
+    """
+    status = get_loader().load()
+    return jsonify(status), 202
+
+
+@routes.route("/corpora/loading", methods=["GET"])
+def get_loading_status():
+    """Status of Loading of Corpora
+    ---
+    get:
+            summary: Loading Status
+            description: Returns the status of the last (or currently running) loading of the corpora.
+            operationId: get_loading_status
             responses:
                 200:
-                    description: Successfully loaded corpora.
-                500:
-                    description: Something went wrong. Could not load data.
+                    description: Status of the loading.
+                    content:
+                        application/json:
+                            schema: LoadingStatusSchema
     """
-    try:
-        corpora.load()
-        return Response("Successfully loaded corpora.", status=200, mimetype="text/plain")
-    except:
-        return Response("Something went wrong.", status=500, mimetype="text/plain")
+    return jsonify(get_loader().status())
 
 
-@api.route("/db", methods=["POST"])
+@routes.route("/db", methods=["POST"])
 def ingest_data():
     """Load data into the triple store
         ---
@@ -362,37 +770,160 @@ def ingest_data():
                 default: https://golemlab.eu/data
                 schema:
                     type: string
+            -   in: query
+                name: validation
+                description: Validation of the data. "rdflib" parses the data, "syntax" checks each line of
+                    N-Triples and N-Quads (Turtle is parsed) and "none" sends the data as it is (only if the service
+                    allows it). Defaults to "syntax" for N-Triples and N-Quads and to "rdflib" for Turtle.
+                required: false
+                schema:
+                    type: string
+                    enum: [rdflib, syntax, none]
+            -   in: query
+                name: wait
+                description: Load the data while the request waits ("true") instead of in the background.
+                required: false
+                default: false
+                schema:
+                    type: boolean
             requestBody:
-                description: Data to load.
+                description: Data to load. N-Triples and N-Quads are read line by line and uploaded in chunks, so
+                    that files of any size can be loaded. After the first blank node label, the rest of the data is
+                    uploaded as one chunk. N-Quads without a graph are loaded into "graph".
                 required: true
                 content:
                     application/x-turtle:
                         schema:
                             type: string
+                    application/n-triples:
+                        schema:
+                            type: string
+                    application/n-quads:
+                        schema:
+                            type: string
             responses:
+                202:
+                    description: The data has been accepted and is loaded in the background. The status of the
+                        ingest job can be requested at the URL in the Location header, see /db/jobs/{job_id}.
+                    content:
+                        application/json:
+                            schema:
+                                type: object
                 201:
-                    description: Successfully ingested data.
+                    description: Successfully ingested data (parameter "wait"). For N-Triples and N-Quads, a
+                        report of the chunks is returned.
                 400:
-                    description: No data included in the request body. Can not load data.
+                    description: No data included in the request body or the data is invalid. Can not load data.
+                        For N-Triples and N-Quads, the report lists the chunks that could not be parsed; the other
+                        chunks have been loaded.
+                403:
+                    description: Loading data without validation is not allowed.
                 500:
-                    description: Something went wrong. Could not load data.
+                    description: Something went wrong. Could not load data. For N-Triples and N-Quads, the report
+                        lists the chunks that failed; the other chunks have been loaded.
+                503:
+                    description: Too many uploads are waiting to be loaded. Try again later.
         """
     if "graph" in request.args:
         graph = str(request.args["graph"])
     else:
         graph = "https://golemlab.eu/data"
 
+    validation = request.args.get("validation")
+    if validation is not None and validation not in ChunkedIngest.validations:
+        return Response("Invalid value of parameter 'validation'.", status=400, mimetype="text/plain")
+
+    if validation == "none" and not ingest_allow_unvalidated:
+        return Response("Loading data without validation is not allowed.", status=403, mimetype="text/plain")
+
+    if request.mimetype in ingest_formats:
+        ingest_format = ingest_formats[request.mimetype]
+        validation = validation or ingest_validation
+    else:
+        ingest_format = "ttl"
+
+    if request.args.get("wait", "false") != "true":
+        # spool the data to disk and load it in the background
+        jobs = get_jobs()
+        if not jobs.accepts():
+            return Response("Too many uploads are waiting to be loaded.", status=503, mimetype="text/plain")
+
+        try:
+            job = jobs.submit(request.stream, graph=graph, format=ingest_format, validation=validation)
+        except QueueFullError:
+            # the queue has been filled by concurrent uploads in the meantime
+            return Response("Too many uploads are waiting to be loaded.", status=503, mimetype="text/plain")
+        except:
+            return Response("Something went wrong.", status=500, mimetype="text/plain")
+
+        if job is None:
+            return Response("No data to load.", status=400, mimetype="text/plain")
+
+        response = jsonify(job.status())
+        response.status_code = 202
+        response.headers["Location"] = url_for(".get_ingest_job", job_id=job.id)
+        return response
+
+    if ingest_format != "ttl":
+        # read the body line by line instead of as a whole
+        ingest = ChunkedIngest(get_db(), graph=graph, format=ingest_format, chunk_size=ingest_chunk_size,
+                               validation=validation, processes=ingest_processes, uploads=ingest_uploads)
+        ingest.run(request.stream)
+        report = ingest.status()
+
+        if ingest.chunks == 0:
+            return Response("No data to load.", status=400, mimetype="text/plain")
+        elif not ingest.failures:
+            status = 201
+        elif all(failure["stage"] == "parse" for failure in ingest.failures):
+            status = 400
+        else:
+            status = 500
+        return jsonify(report), status
+
     data = request.data
     if not data:
         return Response("No data to load.", status=400, mimetype="text/plain")
     try:
-        db.upload(data, graph=graph, format="ttl")
+        get_db().upload(data, graph=graph, format="ttl", validate=validation != "none")
         return Response("Successfully ingested data", status=201, mimetype="text/plain")
     except:
         return Response("Something went wrong.", status=500, mimetype="text/plain")
 
 
-@api.route("/db", methods=["DELETE"])
+@routes.route("/db/jobs/<job_id>", methods=["GET"])
+def get_ingest_job(job_id: str):
+    """Status of an ingest job
+        ---
+        get:
+            summary: Ingest job
+            description: Returns the status of data that has been submitted with POST /db. Includes the progress,
+                throughput and the failed chunks of N-Triples and N-Quads.
+            operationId: get_ingest_job
+            parameters:
+            -   in: path
+                name: job_id
+                description: ID of the job.
+                required: true
+                schema:
+                    type: string
+            responses:
+                200:
+                    description: Status of the job. "state" is "queued", "running", "done" or "failed".
+                    content:
+                        application/json:
+                            schema:
+                                type: object
+                404:
+                    description: No job with this ID.
+        """
+    status = get_jobs().get(job_id)
+    if status is None:
+        return Response(f"No ingest job with ID '{job_id}'.", status=404, mimetype="text/plain")
+    return jsonify(status)
+
+
+@routes.route("/db", methods=["DELETE"])
 def delete_graph():
     """Delete a Named Graph
         ---
@@ -422,7 +953,7 @@ def delete_graph():
         return Response("Graph to delete is not specified.", status=400, mimetype="text/plain")
 
     try:
-        db.delete_graph(graph)
+        get_db().delete_graph(graph)
         return Response("Successfully deleted graph", status=200, mimetype="text/plain")
     except:
         return Response("Something went wrong.", status=500, mimetype="text/plain")
@@ -430,26 +961,212 @@ def delete_graph():
 # End of the API Endpoints
 
 
-# Generate the OpenAPI Specification
-# This can not be moved to the apidoc module,
-# because to generate the Documentation, we need the flask API to be runnable
-with api.test_request_context():
-    spec.path(view=get_info)
-    spec.path(view=get_corpora)
-    spec.path(view=get_corpus_metadata)
-    spec.path(view=get_corpus_characters)
-    spec.path(view=trigger_loading_corpora)
-    spec.path(view=ingest_data)
-    spec.path(view=delete_graph)
+@routes.before_app_request
+def synchronize_data():
+    """Invalidate the data that another worker process has changed, see DB.synchronize()."""
+    get_db().synchronize()
+
+
+@routes.after_app_request
+def compress_response(response: Response) -> Response:
+    """Compress the responses, see ResponseCompressor.compress()."""
+    return get_compressor().compress(request, response)
+
+
+def create_app(warmup: str = None) -> flask.Flask:
+    """Create the flask app of the service.
+
+    Sets up the connection to the Triple Store and starts loading the corpora. Nothing is written to disk, the
+    OpenAPI Specification is generated when the image is built (see write_spec()). Each process of the service
+    creates its own app, e.g. each worker of the pre-fork server (see gunicorn.conf.py), so that connection pools,
+    caches and background threads belong to the process that uses them. The processes invalidate the data changed by
+    other processes through a shared file, see CHANGES_FILE.
+
+    Args:
+        warmup (str, optional): When to load the corpora: "wait", "background" or "lazy". Defaults to
+            CORPORA_WARMUP.
+
+    Returns:
+        Flask: The app.
+    """
+    if warmup is None:
+        warmup = corpora_warmup
+
+    if warmup not in ["wait", "background", "lazy"]:
+        raise Exception("Unknown warmup of the corpora: " + str(warmup))
+
+    # Counter of the changes of the data, shared by the workers of the service
+    if changes_file:
+        changes = ChangeCounter(changes_file)
+    else:
+        changes = None
+
+    # Cache of the SPARQL query results, used by the DB
+    if cache_size > 0:
+        query_cache = QueryCache(max_size=cache_size * 1024 * 1024, default_ttl=cache_ttl, ttls=cache_ttls)
+    else:
+        query_cache = None
+
+    # Establish a connection to the Triple Store with the designated class "DB"
+    # TODO: test, if the connection was successfully established. Although, the __init__ will raise an error
+    # removed graph=triplestore_graph
+    db = DB(
+        triplestore=triplestore_name,
+        protocol=triplestore_protocol,
+        url=triplestore_url,
+        port=str(triplestore_port),
+        username=triplestore_user,
+        password=triplestore_pwd,
+        pool_size=triplestore_pool_size,
+        max_in_flight=triplestore_max_in_flight,
+        pool_timeout=triplestore_pool_timeout,
+        cache=query_cache,
+        changes=changes
+    )
+
+    # Setup of the corpora
+    # The loader holds the current snapshot of the corpora (loader.corpora) and replaces it as a whole when the
+    # corpora are loaded again in the background
+    if corpora_snapshot:
+        snapshot_file = SnapshotFile(corpora_snapshot)
+    else:
+        snapshot_file = None
+
+    loader = CorporaLoader(database=db, interval=corpora_refresh_interval, snapshot_file=snapshot_file)
+    if loader.restore():
+        # serve the restored corpora, check them against the triple store in the background
+        loader.load()
+    elif warmup != "lazy":
+        # load the corpora; if this fails or is deferred, the corpora are loaded with the first request
+        loader.load(wait=warmup == "wait")
+    loader.start()
+    # store the characters that have been loaded in the meantime, too
+    atexit.register(loader.save)
+
+    def invalidate_corpora(event: dict):
+        """Reset the corpora that are affected by a change in the triple store.
+
+        Listener for the invalidation events published by the DB after data has been ingested or deleted.
+        """
+        try:
+            loader.invalidate(uris=event["uris"], types=event["types"])
+        except:
+            pass
+
+    db.add_listener(invalidate_corpora)
+
+    # Compression of the responses, with a cache of compressed payloads
+    if compression_cache_size > 0:
+        payload_cache = PayloadCache(max_size=compression_cache_size * 1024 * 1024)
+    else:
+        payload_cache = None
+
+    compressor = ResponseCompressor(min_size=compression_min_size, level=compression_level, cache=payload_cache)
+
+    # Uploads are loaded in the background
+    jobs = IngestQueue(db, ingest_spool_dir, workers=ingest_workers, max_queued=ingest_max_queued,
+                       chunk_size=ingest_chunk_size, processes=ingest_processes, uploads=ingest_uploads)
+
+    # Setup of flask API
+    app = flask.Flask(__name__)
+    # enable UTF-8 support
+    app.config["JSON_AS_ASCII"] = False
+    app.extensions["golem"] = dict(db=db, loader=loader, compressor=compressor, jobs=jobs)
+    app.register_blueprint(routes)
+
+    return app
+
+
+def generate_spec():
+    """Add the paths of the endpoints to the OpenAPI Specification (apidoc.spec).
+
+    The paths are added only once per process.
+
+    Returns:
+        APISpec: The OpenAPI Specification.
+    """
+    if not spec.to_dict().get("paths"):
+        # To generate the Documentation, we need a flask app with the endpoints, but no connection to the Triple Store
+        app = flask.Flask(__name__)
+        app.register_blueprint(routes)
+        with app.test_request_context():
+            spec.path(view=get_info)
+            spec.path(view=get_corpora)
+            spec.path(view=get_corpus_metadata)
+            spec.path(view=get_corpus_characters)
+            spec.path(view=trigger_loading_corpora)
+            spec.path(view=get_loading_status)
+            spec.path(view=ingest_data)
+            spec.path(view=get_ingest_job)
+            spec.path(view=delete_graph)
+
+    return spec
+
+
+def write_spec() -> bool:
+    """Write the OpenAPI Specification to openapi.yaml and static/swagger-ui/openapi.json (used by the Swagger UI).
+
+    Called by "python api.py" and when the docker image is built, not by the running service, so that it can run on
+    a read-only file system.
 
+    Returns:
+        bool: True if successful.
+    """
+    generate_spec()
+
+    # write the OpenAPI Specification as YAML to the root folder
+    with open('openapi.yaml', 'w') as f:
+        f.write(spec.to_yaml())
+
+    # Write the Specification to the /static folder to use in the Swagger UI
+    with open('static/swagger-ui/openapi.json', 'w') as f:
+        json.dump(spec.to_dict(), f)
+
+    return True
+
+
+def recover_jobs() -> bool:
+    """Mark the ingest jobs that were not finished when the service stopped as failed (see IngestQueue.recover()).
+
+    Called once when the service starts, before any worker process loads jobs: by gunicorn (see gunicorn.conf.py) or
+    by "python api.py".
+
+    Returns:
+        bool: True if successful.
+    """
+    IngestQueue.recover(ingest_spool_dir)
+    return True
+
+
+def init_worker(app: flask.Flask) -> bool:
+    """Set up a worker process that has been forked after the app was created.
+
+    Only needed if the app is loaded before the workers are forked (gunicorn's "preload_app", see gunicorn.conf.py):
+    each worker gets its own connection pool and restarts the background refresh of the corpora. The loaded corpora
+    and the cached query results are kept, so the worker starts warm.
+
+    Args:
+        app (Flask): App returned by create_app().
+
+    Returns:
+        bool: True if successful.
+    """
+    services = app.extensions["golem"]
+    services["db"].after_fork()
+    services["loader"].after_fork()
+    services["jobs"].after_fork()
+    if services["compressor"].cache is not None:
+        services["compressor"].cache.after_fork()
+    return True
 
-# write the OpenAPI Specification as YAML to the root folder
-with open('openapi.yaml', 'w') as f:
-    f.write(spec.to_yaml())
 
-# Write the Specification to the /static folder to use in the Swagger UI
-with open('static/swagger-ui/openapi.json', 'w') as f:
-    json.dump(spec.to_dict(), f)
+if __name__ == "__main__":
+    # "python api.py spec" only writes the OpenAPI Specification, e.g. when the docker image is built
+    write_spec()
+    if sys.argv[1:] == ["spec"]:
+        sys.exit(0)
 
-# Run the Service:
-api.run(debug=debug, host='0.0.0.0', port=service_port)
+    # Run the Service with the flask development server, use gunicorn in production (see gunicorn.conf.py):
+    # Requests are served in threads; the DB class is safe to be used concurrently
+    recover_jobs()
+    create_app().run(debug=debug, host='0.0.0.0', port=service_port, threaded=True)
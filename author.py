@@ -13,19 +13,8 @@ class Author:
         name (str): Name of the author
         refs (list): Identifiers in External Reference Ressources
     """
-    # Database connection
-    database = None
-
-    uri = None
-
-    id = None
-
-    name = None
-
-    refs = None
-    """
-    [{"ref": "Q34660", "type": "wikidata"}]
-    """
+    # Attributes are stored in slots instead of a dictionary per instance
+    __slots__ = ("database", "_uri", "id", "name", "refs")
 
     def __init__(self,
                  database: DB = None,
@@ -43,6 +32,14 @@ class Author:
             name (str): Name of the author
             refs (list): Identifiers in external reference ressources
         """
+        # the attributes are slots without class-level defaults: initialize all of them
+        self.database = None
+        self._uri = None
+        self.id = None
+        self.name = None
+        # References: [{"ref": "Q34660", "type": "wikidata"}]
+        self.refs = None
+
         if database:
             self.database = database
 
@@ -65,6 +62,14 @@ class Author:
         if refs:
             self.refs = refs
 
+    @property
+    def uri(self) -> str:
+        """URI of the author. Stored in a compact form, see GolemQuery.compact_uri()."""
+        return GolemQuery.expand_uri(self._uri)
+
+    @uri.setter
+    def uri(self, uri: str):
+        self._uri = GolemQuery.compact_uri(uri)
 
     def generate_graph(self) -> Graph:
         """Generate graph data of an author.
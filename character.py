@@ -2,6 +2,7 @@ from sparql import DB
 from rdflib import Graph, URIRef, Namespace, RDF, RDFS, Literal, XSD
 from sparql_queries import GolemQuery, EntityId, CharacterName
 from schemas import CharacterSchema
+import sys
 
 
 class Character:
@@ -21,33 +22,24 @@ class Character:
         relations (list): Relations of the character
         metrics (dict): Character Metrics
         corpus_ids (list): IDs of the parent corpus
+        metadata_loaded (bool): Flag that indicates that the metadata has been set from the results of a query
+            (see method hydrate()).
     """
-    # Database connection
-    database = None
-
-    uri = None
-
-    id = None
-
-    character_type = None
-
-    name = None
-
-    gender = None
-
-    refs = None
-
-    source = None
-
-    years = None
-
-    refs = None
-
-    relations = None
-
-    metrics = None
-
-    corpus_ids = None
+    # Attributes are stored in slots instead of a dictionary per instance: corpora keep all their characters in memory
+    __slots__ = ("database", "_uri", "id", "character_type", "name", "gender", "refs", "source", "years",
+                 "relations", "metrics", "corpus_ids", "metadata_loaded")
+
+    # Mapping of the types of characters in the graph to the character types used in the API
+    character_type_mapping = dict(
+        canon_character="canon",
+        canonical_character="canon",
+        fanon_character="fanon",
+        derivative_character="fanon"
+    )
+
+    # Attributes that are stored in a snapshot of the loaded data, see get_state()
+    state_attributes = ("character_type", "name", "gender", "refs", "source", "years", "relations", "metrics",
+                        "corpus_ids", "metadata_loaded")
 
     def __init__(self,
                  database: DB = None,
@@ -61,7 +53,8 @@ class Character:
                  metrics: dict = None,
                  refs: list = None,
                  relations = None,
-                 corpus_ids: list = None
+                 corpus_ids: list = None,
+                 metadata: list = None
                  ):
         """
 
@@ -78,15 +71,41 @@ class Character:
             refs (list): Links to external Reference Resources
             relations (list): Character relations
             corpus_ids (list): IDs of the corpora the character is contained in
+            metadata (list): Simplified results of the query "CorpusCharactersMetadata" of this character.
+                If provided, the character is hydrated with it and no queries are sent.
         """
+        # the attributes are slots without class-level defaults: initialize all of them
+        self.database = None
+        self._uri = None
+        self.id = None
+        self.character_type = None
+        self.name = None
+        self.gender = None
+        self.refs = None
+        self.source = None
+        self.years = None
+        self.relations = None
+        self.metrics = None
+        self.corpus_ids = None
+        self.metadata_loaded = False
+
         if database:
             self.database = database
 
+        # set the id before the uri: the compact uri can share the string of the id
+        if id:
+            self.id = id
+
         if uri:
             self.uri = uri
 
-        if id:
-            self.id = id
+        if metadata:
+            self.hydrate(metadata)
+
+        if self.id:
+            pass
+        elif self.metadata_loaded:
+            pass
         else:
             try:
                 self.get_id()
@@ -120,6 +139,115 @@ class Character:
         if corpus_ids:
             self.corpus_ids = corpus_ids
 
+    @property
+    def uri(self) -> str:
+        """URI of the character. Stored in a compact form, see GolemQuery.compact_uri()."""
+        return GolemQuery.expand_uri(self._uri)
+
+    @uri.setter
+    def uri(self, uri: str):
+        self._uri = GolemQuery.compact_uri(uri)
+        self.__share_id_string()
+
+    def __share_id_string(self):
+        """Use the string of the ID as compact URI, if they are equal, e.g. "C000000001"."""
+        if self._uri is not None and self._uri == self.id:
+            self._uri = self.id
+
+    def hydrate(self, results: list) -> bool:
+        """Set the metadata of the character from the results of the query "CorpusCharactersMetadata".
+
+        Fills id, name, type, gender, refs, source, years and metrics (number of documents) without sending any
+        further queries. If there are multiple values of a field, the first one is used.
+
+        Args:
+            results (list): Simplified results of the SPARQL query "CorpusCharactersMetadata" of this character.
+
+        Returns:
+            bool: True if successful.
+        """
+        for item in results:
+            if "id" in item and not self.id:
+                self.id = item["id"]
+                self.__share_id_string()
+
+            if "name" in item and not self.name:
+                self.name = item["name"]
+
+            if "typeUri" in item and not self.character_type:
+                type_from_graph = item["typeUri"].split("/")[-1]
+                if type_from_graph in self.character_type_mapping:
+                    self.character_type = self.character_type_mapping[type_from_graph]
+
+            if "genderUri" in item and not self.gender:
+                # there are only a few genders: share the strings between the characters
+                self.gender = sys.intern(item["genderUri"].split("/")[-1])
+
+            if "wikidataId" in item:
+                if not self.refs:
+                    self.refs = []
+                ref = dict(type="wikidata", ref=item["wikidataId"])
+                if ref not in self.refs:
+                    self.refs.append(ref)
+
+            if ("sourceName" in item or "sourceUrl" in item) and not self.source:
+                self.source = dict()
+                if "sourceName" in item:
+                    self.source["name"] = item["sourceName"]
+                if "sourceUrl" in item:
+                    self.source["url"] = item["sourceUrl"]
+
+            if "createdYear" in item:
+                if not self.years:
+                    self.years = dict()
+                self.years.setdefault("created", item["createdYear"])
+
+            if "firstFanficYear" in item:
+                if not self.years:
+                    self.years = dict()
+                self.years.setdefault("first_fanfic", item["firstFanficYear"])
+
+            if "numDocuments" in item:
+                if not self.metrics:
+                    self.metrics = dict()
+                self.metrics.setdefault("documents", item["numDocuments"])
+
+        self.metadata_loaded = True
+
+        return True
+
+    def get_state(self) -> dict:
+        """Get the data of the character as a dictionary that can be serialized as JSON.
+
+        Used to store a snapshot of the loaded data, see set_state().
+
+        Returns:
+            dict: URI, ID and the attributes in "state_attributes".
+        """
+        state = dict(uri=self.uri, id=self.id)
+        for attribute in self.state_attributes:
+            state[attribute] = getattr(self, attribute)
+        return state
+
+    def set_state(self, state: dict) -> bool:
+        """Set the data of the character from get_state(). No queries are sent.
+
+        Args:
+            state (dict): Data of the character, see get_state().
+
+        Returns:
+            bool: True if successful.
+        """
+        self.id = state.get("id")
+        self.uri = state.get("uri")
+        for attribute in self.state_attributes:
+            setattr(self, attribute, state.get(attribute))
+
+        if self.gender:
+            self.gender = sys.intern(self.gender)
+
+        return True
+
     def generate_graph(self) -> Graph:
         """Generate graph data of character.
 
@@ -254,7 +382,6 @@ class Character:
             self.name = self.__sparql_single_value(query)
             return self.name
 
-
     def get_metadata(self, validation: bool = False) -> dict:
         """Serialize Character Metadata.
 
@@ -271,19 +398,32 @@ class Character:
             characterName=self.name
         )
 
+        if self.character_type:
+            metadata["characterType"] = self.character_type
+
+        if self.gender:
+            metadata["characterGender"] = self.gender
+
+        if self.refs:
+            metadata["refs"] = self.refs
+
+        if self.source:
+            if "name" in self.source:
+                metadata["sourceName"] = self.source["name"]
+            if "url" in self.source:
+                metadata["sourceUrl"] = self.source["url"]
+
+        if self.years:
+            if "created" in self.years:
+                metadata["createdYear"] = self.years["created"]
+            if "first_fanfic" in self.years:
+                metadata["firstFanficYear"] = self.years["first_fanfic"]
+
+        if self.metrics and "documents" in self.metrics:
+            metadata["numDocuments"] = self.metrics["documents"]
+
         # TODO: implement:
         """
-            id = fields.Str()
-            uri = fields.Str()
-            characterType = fields.Str(validate=validate.OneOf(["canon", "fanon"]))
-            characterName = fields.Str()
-            characterGender = fields.Str(validate=validate.OneOf(["male", "female", "nonbinary"]))
-            refs = fields.Nested(ExternalReferenceSchema, required=False)
-            sourceName = fields.Str()
-            sourceUrl = fields.Str()
-            createdYear = fields.Int()
-            firstFanficYear = fields.Int()
-            numDocuments = fields.Int()
             characterCsvUrl = fields.Str()
             authors = fields.Nested(AuthorSchema)
                 """
@@ -0,0 +1,281 @@
+"""Module to compress responses of the API
+
+Responses are compressed with gzip or, if the package brotli is installed, with brotli. The encoding is negotiated
+with the Accept-Encoding header of the request. brotli is in the requirements of the service (and thus in the docker
+image), but the module works without it.
+"""
+from collections import OrderedDict
+from flask import Request, Response
+import threading
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    # brotli is optional, responses are compressed with gzip only
+    brotli = None
+
+
+class PayloadCache:
+    """Cache of compressed payloads.
+
+    Compressed responses (payload, mimetype and further headers) are stored with their ETag and encoding as key, so
+    that a hot payload is compressed only once per version of the data. If the size of all entries exceeds the memory
+    budget, the least recently used entries are evicted. The cache is safe to be used from multiple threads.
+
+    Attributes:
+        max_size (int): Memory budget in bytes.
+        size (int): Size of all entries in bytes.
+        hits (int): Number of lookups that returned a payload.
+        misses (int): Number of lookups that did not find a payload.
+    """
+
+    def __init__(self, max_size: int = 16 * 1024 * 1024):
+        """Initialize the cache.
+
+        Args:
+            max_size (int): Memory budget in bytes. Defaults to 16 MB.
+        """
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+        # (etag, encoding) -> (payload, mimetype, headers); order of the items is the order of the last use
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def after_fork(self) -> bool:
+        """Replace the lock in a forked worker process; it might have been held by another thread of the parent.
+
+        Returns:
+            bool: True if successful.
+        """
+        self.__lock = threading.Lock()
+        return True
+
+    def get(self, etag: str, encoding: str) -> tuple:
+        """Get a compressed payload.
+
+        Args:
+            etag (str): ETag of the uncompressed response.
+            encoding (str): Content encoding, e.g. "gzip".
+
+        Returns:
+            tuple: Payload (bytes), mimetype and headers or None, if the payload is not cached.
+        """
+        with self.__lock:
+            entry = self.__entries.get((etag, encoding))
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.__entries.move_to_end((etag, encoding))
+            self.hits += 1
+            return entry
+
+    def set(self, etag: str, encoding: str, payload: bytes, mimetype: str, headers: list = None) -> bool:
+        """Store a compressed payload.
+
+        Args:
+            etag (str): ETag of the uncompressed response.
+            encoding (str): Content encoding, e.g. "gzip".
+            payload (bytes): Compressed payload.
+            mimetype (str): Mimetype of the response.
+            headers (list, optional): Further headers of the response as (name, value) tuples.
+
+        Returns:
+            bool: True if the payload has been cached.
+        """
+        if len(payload) > self.max_size:
+            return False
+
+        with self.__lock:
+            previous = self.__entries.pop((etag, encoding), None)
+            if previous is not None:
+                self.size -= len(previous[0])
+
+            self.__entries[(etag, encoding)] = (payload, mimetype, headers)
+            self.size += len(payload)
+
+            while self.size > self.max_size:
+                evicted_payload = self.__entries.popitem(last=False)[1][0]
+                self.size -= len(evicted_payload)
+
+        return True
+
+
+class ResponseCompressor:
+    """Compresses responses of the API.
+
+    Use compress() on each response, e.g. in an "after_request" handler of the flask app. Streamed responses are
+    compressed while they are sent. Responses with an ETag are added to the cache (if there is one), use
+    cached_response() to serve them without building the response again.
+
+    Attributes:
+        min_size (int): Minimum size in bytes of a (not streamed) response to be compressed.
+        level (int): Compression level of gzip (1-9).
+        quality (int): Quality of brotli (0-11).
+        cache (PayloadCache): Cache of compressed payloads. Defaults to None (no caching).
+        encodings (list): Supported content encodings in the order of preference.
+        mimetypes (list): Mimetypes of the responses to compress.
+        uncached_headers (set): Headers (lowercase) of a response that are not stored with a cached payload, because
+            they are set again or depend on the encoding.
+    """
+
+    mimetypes = ["application/json", "application/x-ndjson", "text/plain", "application/yaml"]
+
+    uncached_headers = {"content-type", "content-length", "content-encoding", "etag", "last-modified", "vary"}
+
+    def __init__(self, min_size: int = 1024, level: int = 6, quality: int = 5, cache: PayloadCache = None):
+        """Initialize the compressor.
+
+        Args:
+            min_size (int): Minimum size in bytes of a response to be compressed. Defaults to 1024.
+            level (int): Compression level of gzip. Defaults to 6.
+            quality (int): Quality of brotli. Defaults to 5.
+            cache (PayloadCache, optional): Cache of compressed payloads.
+        """
+        self.min_size = min_size
+        self.level = level
+        self.quality = quality
+        self.cache = cache
+
+        if brotli is not None:
+            self.encodings = ["br", "gzip"]
+        else:
+            self.encodings = ["gzip"]
+
+    def negotiate(self, request: Request) -> str:
+        """Get the content encoding to use for the response to a request.
+
+        Returns:
+            str: Content encoding or None, if the client does not accept any of the supported encodings.
+        """
+        return request.accept_encodings.best_match(self.encodings)
+
+    def etags(self, etag: str) -> list:
+        """Get the ETags of all representations of a response: uncompressed and each content encoding."""
+        return [etag] + [etag + "-" + encoding for encoding in self.encodings]
+
+    def __compressor(self, encoding: str):
+        """Get a new (streaming) compressor with the methods "compress" and "flush"."""
+        if encoding == "br":
+            compressor = brotli.Compressor(quality=self.quality)
+            return compressor.process, compressor.finish
+        else:
+            # wbits 31: gzip container
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+            return compressor.compress, compressor.flush
+
+    def cached_response(self, request: Request, etag: str) -> Response:
+        """Get a compressed response from the cache.
+
+        Args:
+            request (Request): Request.
+            etag (str): ETag of the uncompressed response.
+
+        Returns:
+            Response: Compressed response or None, if there is no cached payload.
+        """
+        if self.cache is None:
+            return None
+
+        encoding = self.negotiate(request)
+        if encoding is None:
+            return None
+
+        entry = self.cache.get(etag, encoding)
+        if entry is None:
+            return None
+
+        payload, mimetype, headers = entry
+        response = Response(payload, mimetype=mimetype)
+        if headers:
+            response.headers.extend(headers)
+        response.headers["Content-Encoding"] = encoding
+        response.vary.add("Accept-Encoding")
+        response.set_etag(etag + "-" + encoding)
+        return response
+
+    def compress(self, request: Request, response: Response) -> Response:
+        """Compress a response.
+
+        Only successful responses of the supported mimetypes are compressed. Responses that are smaller than
+        "min_size" are sent as they are, streamed responses are always compressed. The ETag of a compressed response
+        gets the encoding as suffix.
+
+        Args:
+            request (Request): Request.
+            response (Response): Response.
+
+        Returns:
+            Response: The (compressed) response.
+        """
+        if response.status_code != 200 or response.direct_passthrough or "Content-Encoding" in response.headers:
+            return response
+
+        if response.mimetype not in self.mimetypes:
+            return response
+
+        response.vary.add("Accept-Encoding")
+
+        encoding = self.negotiate(request)
+        if encoding is None:
+            return response
+
+        etag = response.get_etag()[0]
+        compress, flush = self.__compressor(encoding)
+        headers = [(name, value) for name, value in response.headers if name.lower() not in self.uncached_headers]
+
+        if response.is_streamed:
+            chunks = response.response
+            cache = self.cache if etag else None
+            mimetype = response.mimetype
+
+            def generate():
+                # collect the payload to add it to the cache when it is complete
+                parts = [] if cache is not None else None
+                size = 0
+                try:
+                    for chunk in chunks:
+                        if isinstance(chunk, str):
+                            chunk = chunk.encode(response.charset)
+                        data = compress(chunk)
+                        if data:
+                            yield data
+                            if parts is not None:
+                                parts.append(data)
+                                size += len(data)
+                                if size > cache.max_size:
+                                    parts = None
+                    data = flush()
+                    yield data
+                finally:
+                    # e.g. release the connection of streamed SPARQL results, if the client went away
+                    if hasattr(chunks, "close"):
+                        chunks.close()
+
+                if parts is not None:
+                    parts.append(data)
+                    cache.set(etag, encoding, b"".join(parts), mimetype, headers=headers)
+
+            response.response = generate()
+            response.headers.pop("Content-Length", None)
+
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+
+            payload = compress(data) + flush()
+            response.set_data(payload)
+
+            if etag and self.cache is not None:
+                self.cache.set(etag, encoding, payload, response.mimetype, headers=headers)
+
+        response.headers["Content-Encoding"] = encoding
+        if etag:
+            response.set_etag(etag + "-" + encoding)
+
+        return response
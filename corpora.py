@@ -1,6 +1,8 @@
 from corpus import Corpus
 from sparql import DB
-from sparql_queries import CorporaUris, CorporaUrisIds
+from datetime import datetime, timezone
+import threading
+from sparql_queries import CorporaUris, CorporaMetadata
 
 
 class Corpora:
@@ -11,6 +13,11 @@ class Corpora:
         description (str): Description of the collection of corpora.
         database (DB): Triple Store connection of class DB.
         uris (list): List of URIs of corpora.
+        fingerprint (str): Hash of the results of the query that loaded the corpora (see method load()). Used to
+            check whether a snapshot of the corpora is still current, together with the fingerprints of the stored
+            characters (see check_characters()).
+        restored (bool): Flag that indicates that the corpora have been restored from a snapshot on disk and have
+            not been confirmed by a load from the Knowledge Graph yet.
     """
     corpora = None
 
@@ -20,6 +27,10 @@ class Corpora:
 
     uris = None
 
+    fingerprint = None
+
+    restored = False
+
     def __init__(self,
                  corpora: dict = None,
                  description: str = None,
@@ -77,30 +88,110 @@ class Corpora:
     def load(self) -> bool:
         """Load corpora from Knowledge Graph
 
-        Uses a SPARQL Query of class "CorporaUrisIds" of the module "sparql_queries" for fetch the available data
-        from the Knowledge Graph.
+        Uses a SPARQL Query of class "CorporaMetadata" of the module "sparql_queries" to fetch the metadata
+        (including metrics) of all corpora from the Knowledge Graph in a single round trip. The instances of
+        "Corpus" are hydrated from these results and don't send any further queries.
+
+        The corpora are collected in a new dictionary, which replaces "corpora" when it is complete. Readers never see
+        a half-loaded dictionary.
 
         Returns:
             bool: True if successful.
         """
-        # need to do a type conversion, otherwise trying to append to None type
-        if not self.corpora:
-            self.corpora = dict()
-
         if self.database:
-            query = CorporaUrisIds()
+            query = CorporaMetadata()
             query.prepare()
             query.execute(self.database)
             results = query.results.simplify()
 
+            # the order of the solutions is not defined
+            fingerprint = Corpus.get_fingerprint(results)
+
+            # group the solutions by corpus; there is one solution per corpus and metric
+            corpus_results = dict()
             for item in results:
-                id = item["corpus_id"]
-                uri = item["corpus_uri"]
-                corpus = Corpus(database=self.database, uri=uri, id=id)
-                self.add_corpus(corpus)
+                corpus_results.setdefault(item["corpus_uri"], []).append(item)
+
+            corpora = dict()
+            for uri, metadata in corpus_results.items():
+                corpus = Corpus(database=self.database, uri=uri, metadata=metadata)
+                if corpus.id:
+                    corpora[corpus.id] = corpus
+
+            # swap in the loaded corpora
+            self.corpora = corpora
+            self.fingerprint = fingerprint
+            self.restored = False
+
+            return True
         else:
             raise Exception("Can not load corpora without database")
 
+    def invalidate(self, uris: set = None, types: set = None) -> bool:
+        """Invalidate corpora after data in the Knowledge Graph has been changed.
+
+        Resets the corpora that are affected by a change (see Corpus.reset()). Corpora are affected if their URI or
+        the URI of one of their stored characters is in "uris". If no corpus is known to be affected, the change
+        might still concern data of any corpus that is not kept in memory (e.g. a character that has not been
+        stored): the time of the last change of all corpora is updated (see Corpus.touch()). Sends no queries: if the
+        list of corpora itself might have changed (e.g. "uris" is None), the corpora are only touched and must be loaded
+        again (see CorporaLoader.invalidate()).
+        Intended to be used with the invalidation events of DB (see DB.notify()).
+
+        Args:
+            uris (set, optional): URIs affected by the change. If None, all corpora are affected.
+            types (set, optional): Classes (rdf:type) of the changed resources.
+
+        Returns:
+            bool: True if the list of corpora is still current, False if the corpora must be loaded again.
+        """
+        if not self.corpora:
+            return True
+
+        if uris is None:
+            # anything could have changed, e.g. corpora could have been deleted: the corpora are kept until they
+            # have been loaded again
+            for corpus in self.corpora.values():
+                corpus.touch()
+            return False
+
+        affected = False
+        for corpus in self.corpora.values():
+            if corpus.uri in uris:
+                corpus.reset()
+                affected = True
+            elif corpus.characters:
+                for character in corpus.characters.values():
+                    if character.uri in uris:
+                        corpus.reset()
+                        affected = True
+                        break
+
+        if not affected:
+            for corpus in self.corpora.values():
+                corpus.touch()
+
+        # a new corpus might have been added
+        if types and "http://clscor.io/ontology/X1_Corpus" in types:
+            return False
+
+        return True
+
+    def check_characters(self) -> bool:
+        """Check whether the stored characters of all corpora are current (see Corpus.check_characters()).
+
+        Sends a query per corpus with stored characters.
+
+        Returns:
+            bool: True if the characters of all corpora are current.
+        """
+        # keep a reference, "corpora" might be replaced by load() in the meantime
+        corpora = self.corpora
+        if not corpora:
+            return True
+
+        return all(corpus.check_characters() for corpus in corpora.values())
+
     def add_corpus(self, corpus: Corpus) -> bool:
         """Add a corpus instance.
 
@@ -113,9 +204,35 @@ class Corpora:
             bool: True if successful.
         """
         if corpus.id:
+            if self.corpora is None:
+                self.corpora = dict()
             self.corpora[corpus.id] = corpus
             return True
 
+    def get_version(self) -> tuple:
+        """Get the version of the data of all corpora.
+
+        The version only depends on state that all processes of the service share: the fingerprint of the loaded
+        corpora and the changes of the data they have seen (see DB.generation). It changes with every change of the
+        data, no matter which process made it, and is the same in all processes that serve the same data.
+
+        Returns:
+            tuple: Version (list that can be serialized as JSON) and time of the last change of a corpus.
+        """
+        # keep a reference, "corpora" might be replaced by load() in the meantime
+        corpora = self.corpora
+        if self.database is not None:
+            generation = self.database.generation
+        else:
+            generation = None
+        version = [self.fingerprint, generation]
+
+        if not corpora:
+            return version, None
+
+        modified = max(corpus.modified for corpus in corpora.values())
+        return version, modified
+
     def list_corpora(self, include_metrics: bool = False) -> list:
         """Get Metadata of corpora.
 
@@ -125,14 +242,272 @@ class Corpora:
         Returns:
             list: Corpora.
         """
-        corpus_list = list()
-        if self.corpora:
-            for corpus_id in self.corpora.keys():
+        # TODO: check if I can load the corpora here
+        return list(self.iter_corpora(include_metrics=include_metrics))
+
+    def iter_corpora(self, include_metrics: bool = False):
+        """Get Metadata of corpora one by one.
+
+        Generator version of list_corpora(), e.g. to stream the corpora in a response.
+
+        Args:
+            include_metrics (bool): Include metrics for each corpus. Defaults to False.
+
+        Yields:
+            dict: Metadata of a corpus.
+        """
+        # keep a reference, "corpora" might be replaced by load() in the meantime
+        corpora = self.corpora
+        if corpora:
+            for corpus in corpora.values():
                 # this assumes, that a database connection is defined inside the corpus
                 # TODO: handle the error of missing database connection
-                corpus_item = self.corpora[corpus_id].get_metadata(include_metrics=include_metrics)
-                corpus_list.append(corpus_item)
+                yield corpus.get_metadata(include_metrics=include_metrics)
 
-        # TODO: check if I can load the corpora here
-        return corpus_list
 
+class CorporaLoader:
+    """Loads corpora in the background.
+
+    Every load builds a new instance of "Corpora" (a snapshot), which replaces the current one when it is complete.
+    Readers keep using the current snapshot while a load is running. Optionally, the corpora are loaded again
+    periodically.
+
+    If a snapshot file is set, the corpora can be restored from disk when the service starts (see restore()) and are
+    written to it after each load (see save()).
+
+    Attributes:
+        database (DB): Triple Store connection of class DB.
+        corpora (Corpora): Current snapshot of the corpora. Is replaced as a whole.
+        interval (float): Interval of the periodic refresh in seconds. Defaults to None (no periodic refresh).
+        snapshot_file (SnapshotFile): File to store the corpora on disk. Defaults to None.
+        state (str): State of the last load: "idle" (never loaded), "restored" (from the snapshot file), "running",
+            "done" or "failed".
+        started (datetime): Start of the last load.
+        finished (datetime): End of the last load.
+        error (str): Error message of the last load, if it failed.
+    """
+    database = None
+
+    corpora = None
+
+    interval = None
+
+    snapshot_file = None
+
+    state = "idle"
+
+    started = None
+
+    finished = None
+
+    error = None
+
+    def __init__(self, database: DB = None, interval: float = None, snapshot_file=None):
+        """Initialize the loader.
+
+        Args:
+            database (DB): Triple Store connection of class DB.
+            interval (float, optional): Interval of the periodic refresh in seconds. Use start() to start it.
+            snapshot_file (SnapshotFile, optional): File to store the corpora on disk, see module "snapshot".
+        """
+        if database:
+            self.database = database
+
+        if interval:
+            self.interval = interval
+
+        if snapshot_file:
+            self.snapshot_file = snapshot_file
+
+        # empty snapshot until the first load is done
+        self.corpora = Corpora(database=self.database)
+
+        self.__lock = threading.Lock()
+        self.__thread = None
+        self.__reload = False
+        self.__timer = None
+
+    def __run(self):
+        """Load a new snapshot and swap it in. Runs in a thread."""
+        while True:
+            try:
+                snapshot = Corpora(database=self.database)
+                snapshot.load()
+                current = self.corpora
+                if current.restored and current.fingerprint == snapshot.fingerprint and current.check_characters():
+                    # the corpora restored from disk (and their characters) are current: keep them
+                    current.restored = False
+                else:
+                    # the assignment is atomic: readers either get the old or the new snapshot
+                    self.corpora = snapshot
+                    self.save()
+                state = "done"
+                error = None
+            except Exception as exception:
+                state = "failed"
+                error = str(exception)
+
+            with self.__lock:
+                # data changed while loading: the snapshot might be outdated, load once more
+                if self.__reload and state == "done":
+                    self.__reload = False
+                    continue
+
+                self.__reload = False
+                self.state = state
+                self.error = error
+                self.finished = datetime.now(timezone.utc)
+                self.__thread = None
+                return
+
+    def load(self, wait: bool = False) -> dict:
+        """Load the corpora in a background thread.
+
+        If a load is already running, no new load is started.
+
+        Args:
+            wait (bool): Wait until the load is finished. Defaults to False.
+
+        Returns:
+            dict: Status of the load, see method status().
+        """
+        with self.__lock:
+            if self.__thread is None:
+                self.state = "running"
+                self.started = datetime.now(timezone.utc)
+                self.finished = None
+                self.error = None
+                self.__thread = threading.Thread(target=self.__run, daemon=True)
+                self.__thread.start()
+            thread = self.__thread
+
+        if wait and thread is not None:
+            thread.join()
+
+        return self.status()
+
+    def restore(self) -> bool:
+        """Restore the corpora from the snapshot file.
+
+        The restored corpora are served right away. Use load() afterwards to check them against the Knowledge Graph:
+        if they are still current, they are kept, otherwise they are replaced.
+
+        Returns:
+            bool: True if corpora have been restored.
+        """
+        if self.snapshot_file is None:
+            return False
+
+        snapshot = self.snapshot_file.read(database=self.database)
+        if snapshot is None or not snapshot.corpora:
+            return False
+
+        with self.__lock:
+            if self.corpora.corpora:
+                # already loaded
+                return False
+            self.corpora = snapshot
+            self.state = "restored"
+
+        return True
+
+    def save(self) -> bool:
+        """Write the current corpora to the snapshot file, e.g. before the service stops.
+
+        Errors are ignored: the snapshot file is only a cache.
+
+        Returns:
+            bool: True if the corpora have been written.
+        """
+        corpora = self.corpora
+        if self.snapshot_file is None or not corpora.corpora or corpora.restored:
+            return False
+
+        try:
+            return self.snapshot_file.write(corpora)
+        except Exception:
+            return False
+
+    def status(self) -> dict:
+        """Get the status of the last load.
+
+        Returns:
+            dict: State, start and end, error message, number of loaded corpora and refresh interval.
+        """
+        status = dict(
+            state=self.state,
+            started=self.started.isoformat() if self.started else None,
+            finished=self.finished.isoformat() if self.finished else None,
+            error=self.error,
+            corpora=len(self.corpora.corpora) if self.corpora.corpora else 0,
+            interval=self.interval
+        )
+        return status
+
+    def invalidate(self, uris: set = None, types: set = None) -> bool:
+        """Invalidate the current snapshot after data in the Knowledge Graph has been changed.
+
+        Resets the affected corpora of the current snapshot, see Corpora.invalidate(). If the list of corpora might
+        have changed, the corpora are loaded again in the background (see load()); the current snapshot is served
+        until the load is finished. If a load is running, it is repeated once, because the new snapshot might have
+        been loaded before the change: repeated changes during a load are handled by a single further load. Does not
+        wait for any query, so it can be called while requests are served.
+
+        Args:
+            uris (set, optional): URIs affected by the change. If None, all corpora are affected.
+            types (set, optional): Classes (rdf:type) of the changed resources.
+
+        Returns:
+            bool: True if successful.
+        """
+        with self.__lock:
+            if self.__thread is not None:
+                self.__reload = True
+
+        corpora = self.corpora
+        if not corpora.invalidate(uris=uris, types=types):
+            self.load()
+
+        return True
+
+    def __schedule(self):
+        """Schedule the next periodic refresh."""
+        self.__timer = threading.Timer(self.interval, self.__refresh)
+        self.__timer.daemon = True
+        self.__timer.start()
+
+    def __refresh(self):
+        """Periodic refresh. Runs in the timer thread."""
+        self.load(wait=True)
+        self.__schedule()
+
+    def start(self) -> bool:
+        """Start the periodic refresh, if an interval is set.
+
+        Returns:
+            bool: True if the periodic refresh has been started.
+        """
+        if self.interval and self.__timer is None:
+            self.__schedule()
+            return True
+        else:
+            return False
+
+    def after_fork(self) -> bool:
+        """Restart the loader in a forked worker process.
+
+        Threads (a running load, the timer of the periodic refresh) are not copied to the child process. The lock is
+        replaced, a load that did not finish before the fork is started again and so is the periodic refresh. The
+        current snapshot is kept, so the worker starts with loaded corpora.
+
+        Returns:
+            bool: True if successful.
+        """
+        self.__lock = threading.Lock()
+        self.__reload = False
+        self.__timer = None
+        if self.__thread is not None:
+            self.__thread = None
+            self.load()
+        self.start()
+        return True
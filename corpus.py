@@ -1,10 +1,14 @@
-from sparql import DB
+from sparql import DB, SparqlTemplate
 from sparql_queries import CorpusMetrics, CorpusName, CorpusAcronym, CorpusId, CorpusCharacterConceptUris, \
-    CorpusDescription, CorpusLicence, CorpusCharactersUriIdName
+    CorpusDescription, CorpusLicence, CorpusCharactersUriIdName, CorpusMetadata, CorpusCharactersMetadata, \
+    CorpusCharactersUriIdNamePage, CorpusCharactersCount
 from schemas import CorpusSchema
 from rdflib import Graph, URIRef, Namespace, RDF, RDFS, Literal, XSD
 from sparql_queries import GolemQuery
 from character import Character
+from datetime import datetime, timezone
+import hashlib
+import json
 
 
 class Corpus:
@@ -21,35 +25,33 @@ class Corpus:
         repository (dic) : Repository
         metrics (dict) : Metrics of a corpus
         characters (dict): Characters in the corpus
+        metadata_loaded (bool): Flag that indicates that all metadata has been loaded with a single query
+            (see method load_metadata()).
+        characters_fingerprint (str): Hash of the results of the query that loaded the stored characters (see
+            method load_characters()). Used to check whether the characters of a snapshot are still current.
+        modified (datetime): Time the corpus has been created (e.g. loaded again) or its data has changed (see method
+            touch()).
     """
-    # Database connection
-    database = None
-
-    uri = None
-
-    id = None
-
-    name = None # This is deprecated!
-
-    acronym = None
-
-    # Description of the Corpus
-    description = None
-
-    # Licence
-    licence = None
-
-    # Repository
-    repository = None
-
-    # Metrics of the corpus
-    metrics = None
-
-    # Characters
-    characters = None
-    """
-    {"id": Character}
-    """
+    # Attributes are stored in slots instead of a dictionary per instance
+    __slots__ = ("database", "_uri", "id", "name", "acronym", "description", "licence", "repository", "metrics",
+                 "characters", "metadata_loaded", "characters_fingerprint", "modified")
+
+    # Mapping of the keys of the metrics in the graph to the keys used in the API;
+    # unfortunately, this has to be hardcoded here; Maybe the label could be included somewhere in the graph instead
+    metrics_mapping = dict(
+        number_of_chapters="chapters",
+        number_of_characters="characters",
+        number_of_comments="comments",
+        number_of_documents="documents",
+        number_of_female_characters="female",
+        number_of_male_characters="male",
+        number_of_nonbinary_characters="nonbinary",
+        number_of_paragraphs="paragraphs"
+    )
+
+    # Attributes that are stored in a snapshot of the loaded data, see get_state()
+    state_attributes = ("id", "name", "acronym", "description", "licence", "repository", "metrics",
+                        "metadata_loaded", "characters_fingerprint")
 
     def __init__(self,
                  database: DB = None,
@@ -60,7 +62,8 @@ class Corpus:
                  description: str = None,
                  licence: dict = None,
                  repository: dict = None,
-                 metrics: dict = None
+                 metrics: dict = None,
+                 metadata: list = None
                  ):
         """
 
@@ -74,15 +77,39 @@ class Corpus:
             licence (dict): Licence Information
             repository (dict): Repository Information
             metrics (dict): Corpus Metrics
+            metadata (list): Simplified results of the query "CorpusMetadata" (or "CorporaMetadata") of this corpus.
+                If provided, the corpus is hydrated with it and no queries are sent.
         """
+        # the attributes are slots without class-level defaults: initialize all of them
+        self.database = None
+        self._uri = None
+        self.id = None
+        self.name = None  # This is deprecated!
+        self.acronym = None
+        self.description = None
+        self.licence = None
+        self.repository = None
+        self.metrics = None
+        # Characters: {"id": Character}
+        self.characters = None
+        self.metadata_loaded = False
+        self.characters_fingerprint = None
+        self.modified = None
+        self.touch()
+
         if database:
             self.database = database
 
         if uri:
             self.uri = uri
 
+        if metadata:
+            self.hydrate(metadata)
+
         if id:
             self.id = id
+        elif self.metadata_loaded:
+            pass
         else:
             # try to SPARQL the ID
             try:
@@ -93,6 +120,8 @@ class Corpus:
         # Name is somewhat deprecated
         if name:
             self.name = name
+        elif self.metadata_loaded:
+            pass
         else:
             # try to sparql the name from the knowledge graph
             try:
@@ -115,6 +144,15 @@ class Corpus:
         if metrics:
             self.metrics = metrics
 
+    @property
+    def uri(self) -> str:
+        """URI of the corpus. Stored in a compact form, see GolemQuery.compact_uri()."""
+        return GolemQuery.expand_uri(self._uri)
+
+    @uri.setter
+    def uri(self, uri: str):
+        self._uri = GolemQuery.compact_uri(uri)
+
     def __sparql_single_value(self, query: GolemQuery):
         """Helper function to query a single value.
 
@@ -141,6 +179,149 @@ class Corpus:
         else:
             raise Exception("Can't retrieve data without database connection.")
 
+    def reset(self) -> bool:
+        """Reset the metadata, metrics and characters of the corpus.
+
+        Used to invalidate the data after it has been changed in the Knowledge Graph. URI and ID are kept; the
+        other data is queried again on the next request (see method load_metadata()).
+
+        Returns:
+            bool: True if successful.
+        """
+        self.name = None
+        self.acronym = None
+        self.description = None
+        self.licence = None
+        self.metrics = None
+        self.characters = None
+        self.metadata_loaded = False
+        self.characters_fingerprint = None
+        self.touch()
+        return True
+
+    def touch(self) -> bool:
+        """Update the time of the last change of the corpus, e.g. after it has been changed in the Knowledge Graph.
+
+        Returns:
+            bool: True if successful.
+        """
+        self.modified = datetime.now(timezone.utc)
+        return True
+
+    @staticmethod
+    def get_fingerprint(results: list) -> str:
+        """Compute a hash of simplified query results, independent of the order of the solutions.
+
+        Args:
+            results (list): Simplified results of a query (see SparqlResults.simplify()).
+
+        Returns:
+            str: SHA-1 hash as hex string.
+        """
+        rows = sorted(json.dumps(item, sort_keys=True, default=str) for item in results)
+        return hashlib.sha1(json.dumps(rows).encode("utf-8")).hexdigest()
+
+    def __metric_key(self, dimension_uri: str, use_mapping: bool = False) -> str:
+        """Get the key of a metric from the URI of the dimension.
+
+        Args:
+            dimension_uri (str): URI of the dimension (crm:E54_Dimension), e.g. ".../dimension/number_of_chapters".
+            use_mapping (bool): Map the key with "metrics_mapping". Defaults to False.
+        """
+        key_from_graph = dimension_uri.split("/")[-1:][0]
+        if use_mapping and key_from_graph in self.metrics_mapping:
+            return self.metrics_mapping[key_from_graph]
+        else:
+            return key_from_graph
+
+    def hydrate(self, results: list) -> bool:
+        """Set the metadata of the corpus from the results of the query "CorpusMetadata".
+
+        Fills id, name, acronym, description, licence and metrics (keys are mapped with "metrics_mapping")
+        without sending any further queries.
+
+        Args:
+            results (list): Simplified results of the SPARQL query "CorpusMetadata", one item per metric.
+
+        Returns:
+            bool: True if successful.
+        """
+        metrics = dict()
+
+        for item in results:
+            if "id" in item and not self.id:
+                self.id = item["id"]
+
+            if "name" in item and not self.name:
+                self.name = item["name"]
+
+            if "acronym" in item and not self.acronym:
+                self.acronym = item["acronym"]
+
+            if "description" in item and not self.description:
+                self.description = item["description"]
+
+            if "licenceName" in item and "licenceUri" in item and not self.licence:
+                self.licence = dict(name=item["licenceName"], uri=item["licenceUri"])
+
+            if "dimensionURI" in item and "value" in item:
+                metrics[self.__metric_key(item["dimensionURI"], use_mapping=True)] = item["value"]
+
+        if not self.metrics:
+            self.metrics = metrics
+
+        self.metadata_loaded = True
+
+        return True
+
+    def get_state(self) -> dict:
+        """Get the data of the corpus as a dictionary that can be serialized as JSON.
+
+        Used to store a snapshot of the loaded data, see set_state(). The characters are not included, see
+        Character.get_state().
+
+        Returns:
+            dict: URI and the attributes in "state_attributes".
+        """
+        state = dict(uri=self.uri)
+        for attribute in self.state_attributes:
+            state[attribute] = getattr(self, attribute)
+        return state
+
+    def set_state(self, state: dict) -> bool:
+        """Set the data of the corpus from get_state(). No queries are sent.
+
+        Args:
+            state (dict): Data of the corpus, see get_state().
+
+        Returns:
+            bool: True if successful.
+        """
+        self.uri = state.get("uri")
+        for attribute in self.state_attributes:
+            setattr(self, attribute, state.get(attribute))
+        return True
+
+    def load_metadata(self) -> bool:
+        """Load all metadata of the corpus with a single query.
+
+        Uses SPARQL Query "CorpusMetadata" of the module "sparql_queries".
+
+        Returns:
+            bool: True if successful.
+        """
+        if self.database:
+            if self.uri:
+                query = CorpusMetadata()
+                query.prepare()
+                query.inject([self.uri])
+                query.execute(self.database)
+                return self.hydrate(query.results.simplify())
+            else:
+                raise Exception("Can not retrieve data without Corpus URI. Set attribute uri first")
+        else:
+            raise Exception("Can't retrieve data without database connection.")
+
     def get_metrics(self, use_mapping: bool = False) -> dict:
         """Assemble and return corpus metrics.
 
@@ -164,42 +345,8 @@ class Corpus:
 
                     metrics = dict()
 
-                    if use_mapping:
-                        # map the keys of the results of the SPARQL query; unfortunately, this has to be hardcoded here;
-                        # Maybe the label could be included somewhere in the graph istead
-                        """
-                        'number_of_chapters': 700000,
-                        'number_of_characters': 20,
-                        'number_of_comments': 123,
-                        'number_of_documents': 200000,
-                        'number_of_female_characters': 8,
-                        'number_of_nonbinary_characters': 2,
-                        'number_of_paragraphs': 9000000,
-                        'number_of_words-comments': 123000,
-                        'number_of_words-text': 2000000000}
-                        """
-                        mapping = dict(
-                            number_of_chapters="chapters",
-                            number_of_characters="characters",
-                            number_of_comments="comments",
-                            number_of_documents="documents",
-                            number_of_female_characters="female",
-                            number_of_male_characters="male",
-                            number_of_nonbinary_characters="nonbinary",
-                            number_of_paragraphs="paragraphs"
-                        )
-                    else:
-                        mapping = None
-
                     for item in results:
-                        key_from_graph = item["dimensionURI"].split("/")[-1:][0]
-                        if mapping:
-                            if key_from_graph in mapping:
-                                key = mapping[key_from_graph]
-                            else:
-                                key = key_from_graph
-                        else:
-                            key = key_from_graph
+                        key = self.__metric_key(item["dimensionURI"], use_mapping=use_mapping)
                         value = item["value"]
                         metrics[key] = value
 
@@ -294,15 +441,19 @@ class Corpus:
             dict: Serialization of the corpus metadata.
         """
 
+        # fetch all metadata in a single round trip; afterwards the attributes are used as they are
+        if not self.metadata_loaded:
+            self.load_metadata()
+
         metadata = dict(
             id=self.id,
             uri=self.uri,
-            corpusName=self.get_name(),
-            acronym=self.get_acronym(),
-            corpusDescription=self.get_description(),
+            corpusName=self.name,
+            acronym=self.acronym,
+            corpusDescription=self.description,
         )
 
-        licence_data = self.get_licence()
+        licence_data = self.licence
         if licence_data:
             if "name" in licence_data:
                 metadata["licence"] = licence_data["name"]
@@ -316,7 +467,8 @@ class Corpus:
 
         if include_metrics is True:
             # Use the hardcoded mappings by setting use_mapping to True
-            metadata["metrics"] = self.get_metrics(use_mapping=True)
+            # metrics of the corpus are included in the loaded metadata, keys are already mapped
+            metadata["metrics"] = self.metrics
 
         if include_characters is True:
             # only sparql the data
@@ -344,39 +496,151 @@ class Corpus:
         results = query.results.simplify()
         return results
 
-    def get_characters(self, store=False):
+    def get_characters(self, store=False, stream=False):
         """Fetch characters from the triple store.
 
         Sparql for character information and, optionally, add instances of class Character to
         self.characters with character id as keys.
 
-        Uses SPARQL Query "CorpusCharactersUriIdName" from sparql_queries.py .
+        Uses SPARQL Query "CorpusCharactersUriIdName" from sparql_queries.py . The stored characters are hydrated
+        with all their metadata (see load_characters()).
 
         Args:
             store (bool): Store the characters as instances of Character in self.characters Defaults to False.
+            stream (bool): Return a generator, that yields the characters while the results are streamed from the
+                triple store (see DB.sparql()). Keeps memory bounded for very large corpora. Defaults to False.
+                Can not be combined with "store".
         """
 
+        if store:
+            return self.load_characters()
+
         query = CorpusCharactersUriIdName()
         query.inject([self.uri])
-        query.execute(self.database)
         mapping = {"name": {"key":"characterName"}}
-        characters = query.results.simplify(mapping=mapping)
 
-        if not store:
-            return characters
+        if stream and not store:
+            query.execute(self.database, stream=True)
+            return query.results.iter_simplify(mapping=mapping)
+
+        query.execute(self.database)
+        return query.results.simplify(mapping=mapping)
+
+    def get_characters_page(self, limit: int, offset: int = 0, after: tuple = None) -> dict:
+        """Fetch a page of the characters from the triple store.
+
+        The characters are ordered by ID and URI. Use "after" to get the next page (keyset pagination): the query
+        only returns characters after the last character of the previous page, no matter how many pages have been
+        fetched before.
+
+        Uses SPARQL Queries "CorpusCharactersUriIdNamePage" and "CorpusCharactersCount" from sparql_queries.py.
+
+        Args:
+            limit (int): Maximum number of characters.
+            offset (int, optional): Number of characters to skip. Defaults to 0.
+            after (tuple, optional): ID and URI of the last character of the previous page.
+
+        Returns:
+            dict: Characters ("characters"), same items as get_characters(), the total number of characters
+                ("total") and ID and URI of the last character ("last"), if there might be more characters
+                (otherwise None).
+        """
+        if after:
+            after_id, after_uri = after
         else:
-            if not self.characters:
-                self.characters = {}
+            after_id, after_uri = "", ""
 
-            for item in characters:
-                character = Character(database=self.database, uri=item["uri"], id=item["id"])
-                if "characterName" in item:
-                    if item["characterName"]:
-                        character.name = item["characterName"]
-                self.characters[item["id"]] = character
+        query = CorpusCharactersUriIdNamePage()
+        query.inject([self.uri, SparqlTemplate.literal(after_id), SparqlTemplate.literal(after_uri),
+                      SparqlTemplate.integer(limit), SparqlTemplate.integer(offset)])
+        query.execute(self.database)
+        characters = query.results.simplify(mapping={"name": {"key": "characterName"}})
+
+        count_query = CorpusCharactersCount()
+        count_query.inject([self.uri])
+        count_query.execute(self.database)
+        counts = count_query.results.simplify(mapping={"count": {"datatype": "int"}})
+
+        if len(characters) == limit and limit > 0:
+            last = (characters[-1]["id"], characters[-1]["uri"])
+        else:
+            last = None
 
+        return dict(characters=characters, total=counts[0] if counts else 0, last=last)
+
+    def load_characters(self) -> bool:
+        """Load all characters of the corpus with their metadata with a single query.
+
+        Adds instances of class Character to self.characters with character id as keys. The characters are
+        hydrated from the results (see Character.hydrate()), no further query is sent per character.
+        Characters without an ID are skipped.
+
+        Uses SPARQL Query "CorpusCharactersMetadata" from sparql_queries.py.
+
+        Returns:
+            bool: True if successful.
+        """
+        results = self.__query_characters_metadata()
+
+        # a character can be in multiple solutions: collect them by URI, keeping the order of the results
+        results_by_uri = dict()
+        for item in results:
+            results_by_uri.setdefault(item["uri"], []).append(item)
+
+        if not self.characters:
+            self.characters = {}
+
+        for uri, character_results in results_by_uri.items():
+            character = Character(database=self.database, uri=uri, metadata=character_results)
+            if character.id:
+                self.characters[character.id] = character
+
+        self.characters_fingerprint = self.get_fingerprint(results)
+
+        return True
+
+    def check_characters(self) -> bool:
+        """Check whether the stored characters are current, e.g. after they have been restored from a snapshot.
+
+        Queries the metadata of the characters again and compares it with the fingerprint of the stored characters.
+
+        Returns:
+            bool: True if the characters are current or none are stored.
+        """
+        if not self.characters:
             return True
 
+        if self.characters_fingerprint is None:
+            return False
+
+        return self.get_fingerprint(self.__query_characters_metadata()) == self.characters_fingerprint
+
+    def __query_characters_metadata(self) -> list:
+        """Query the metadata of all characters of the corpus.
+
+        Uses SPARQL Query "CorpusCharactersMetadata" from sparql_queries.py.
+
+        Returns:
+            list: Simplified results, a character can be in multiple solutions.
+        """
+        if not self.database:
+            raise Exception("Can't retrieve data without database connection.")
+
+        if not self.uri:
+            raise Exception("Can not retrieve data without Corpus URI. Set attribute uri first")
+
+        query = CorpusCharactersMetadata()
+        query.inject([self.uri])
+        query.execute(self.database)
+
+        mapping = {
+            "createdYear": {"datatype": "int"},
+            "firstFanficYear": {"datatype": "int"},
+            "numDocuments": {"datatype": "int"}
+        }
+
+        return query.results.simplify(mapping=mapping)
+
     def generate_graph(self) -> Graph:
         """Generate graph data of corpus.
 
@@ -0,0 +1,56 @@
+"""Configuration of gunicorn, the pre-fork WSGI server to run the service in production
+
+Run the service with:
+    gunicorn --config gunicorn.conf.py "api:create_app()"
+
+The number of worker processes and threads is taken from environment variables. Each worker creates its own app
+(see api.create_app()) with its own connection pool to the Triple Store, its own caches and loaded corpora. Note that
+CONN_POOL_SIZE and CONN_MAX_IN_FLIGHT apply per worker.
+
+After a worker has loaded or deleted data, it increments a counter in a file shared by all workers (CHANGES_FILE, see
+sparql.ChangeCounter). The other workers compare the counter before each request and then invalidate their cached
+query results and load their corpora again in the background. With CHANGES_FILE disabled, other workers would serve
+stale data for up to CACHE_TTL (and stale corpora until the next refresh): run a single worker (SERVICE_WORKERS=1) in
+that case.
+"""
+import multiprocessing
+import os
+
+bind = "0.0.0.0:" + str(os.environ.get("SERVICE_PORT", 5000))
+"""SERVICE_PORT: Port of the running service.
+"""
+
+workers = int(os.environ.get("SERVICE_WORKERS", multiprocessing.cpu_count()))
+"""SERVICE_WORKERS: Number of worker processes. Defaults to the number of CPUs.
+"""
+
+threads = int(os.environ.get("SERVICE_THREADS", 4))
+"""SERVICE_THREADS: Number of threads per worker, that handle requests concurrently. Requests mostly wait for the
+Triple Store, so a few threads per worker keep the CPUs busy.
+"""
+
+worker_class = "gthread"
+
+timeout = int(os.environ.get("SERVICE_TIMEOUT", 120))
+"""SERVICE_TIMEOUT: Seconds after which a worker that does not respond is restarted. Large uploads and, with
+CORPORA_WARMUP "wait", loading the corpora when a worker starts must finish within this time.
+"""
+
+preload_app = os.environ.get("SERVICE_PRELOAD", "FALSE") == "TRUE"
+"""SERVICE_PRELOAD: Create the app once before the workers are forked (TRUE) instead of once per worker (FALSE).
+The corpora are loaded only once, the workers set up their own connection pools after the fork (see post_worker_init).
+Use it with CORPORA_WARMUP "wait", so that the workers get loaded corpora.
+"""
+
+
+def on_starting(server):
+    """Clean up the ingest jobs of a previous run before the workers are started, see api.recover_jobs()."""
+    import api
+    api.recover_jobs()
+
+
+def post_worker_init(worker):
+    """Set up a worker after it has been forked from a preloaded app, see api.init_worker()."""
+    if worker.cfg.preload_app:
+        import api
+        api.init_worker(worker.wsgi)
@@ -0,0 +1,581 @@
+"""Module to load large RDF files into the Triple Store
+
+N-Triples, N-Quads and Turtle are read line by line and sent in chunks of a bounded number of statements, so memory
+does not grow with the size of the file. Each chunk is checked and uploaded on its own; a chunk that fails does not
+stop the ingest, it is reported in the status (see ChunkedIngest.status()). Chunks can be parsed in parallel processes
+and uploaded concurrently.
+"""
+from sparql import DB
+from rdflib import Graph, ConjunctiveGraph, BNode, RDF
+from rdflib.graph import DATASET_DEFAULT_GRAPH_ID
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
+import multiprocessing
+import re
+import threading
+
+# Terms of the N-Triples and N-Quads grammar, see https://www.w3.org/TR/n-triples/#n-triples-grammar
+# IRIs must be absolute, i.e. start with a scheme
+IRIREF = r'<[A-Za-z][A-Za-z0-9+.\-]*:(?:[^\x00-\x20<>"{}|^`\\]|\\u[0-9A-Fa-f]{4}|\\U[0-9A-Fa-f]{8})*>'
+BLANK_NODE_LABEL = r'_:[A-Za-z0-9_\u00C0-\U000EFFFF](?:[A-Za-z0-9_\-.\u00B7\u00C0-\U000EFFFF]*' \
+                   r'[A-Za-z0-9_\-\u00B7\u00C0-\U000EFFFF])?'
+LITERAL = r'"(?:[^"\\\n\r]|\\[tbnrf"\'\\]|\\u[0-9A-Fa-f]{4}|\\U[0-9A-Fa-f]{8})*"' \
+          r'(?:\^\^' + IRIREF + r'|@[a-zA-Z]+(?:-[a-zA-Z0-9]+)*)?'
+
+
+class ChunkedIngest:
+    """Streams N-Triples, N-Quads or Turtle into the Triple Store in chunks.
+
+    N-Triples and N-Quads have one statement per line, so the data can be split at any line. Every chunk is checked
+    (see "validation"), then the original lines are sent (N-Triples are valid Turtle). N-Quads are sent per named
+    graph of the chunk. Turtle is split at the ends of statements (see scan_turtle()), the directives are put in
+    front of each chunk. After each chunk, an invalidation event with the URIs of the chunk is published (see
+    DB.notify()).
+
+    With "processes" > 1, the chunks are checked in a pool of processes (see prepare()), with "uploads" > 1 they are
+    uploaded concurrently over the connection pool of the DB. The order of the chunks in the Triple Store is not
+    relevant.
+
+    Validation modes:
+        "rdflib": Each chunk is parsed with rdflib.
+        "syntax": Each line is checked with a regular expression of the N-Triples/N-Quads grammar. Much faster, no
+            graph is built. Escape sequences and the values of literals are not checked.
+        "none": The lines are sent without checks, for trusted data. The URIs of the data are not known: a single
+            invalidation event that affects all data is published at the end. N-Quads are split by graph with the
+            checks of "syntax".
+    Turtle is always parsed with rdflib (and sent as N-Triples), unless the validation mode is "none".
+
+    Blank node labels are scoped to the document they are sent in. So that a blank node does not become several
+    nodes in the Triple Store, the data is not split any more after the first blank node label ("_:"): the rest of
+    the data is sent as a single (last) chunk. N-Quads are still sent per graph, so a blank node must not be used in
+    more than one graph.
+
+    Attributes:
+        database (DB): Triple Store connection of class DB.
+        graph (str): Name of the named graph. Target of N-Triples and of N-Quads without a graph.
+        format (str): Format of the data: "nt" (N-Triples), "nq" (N-Quads) or "ttl" (Turtle).
+        chunk_size (int): Maximum number of statements per chunk.
+        validation (str): Validation mode of the chunks: "rdflib", "syntax" or "none".
+        processes (int): Number of processes that check the chunks. 1: the chunks are checked in the thread that
+            uploads them.
+        uploads (int): Number of chunks that are uploaded at the same time.
+        progress: Function that is called with the status (see status()) after each chunk. Defaults to None.
+        statements (int): Number of statements uploaded so far.
+        chunks (int): Number of chunks processed so far.
+        bytes (int): Number of bytes read so far.
+        failures (list): Chunks that failed: number of the chunk, first and last line, stage ("parse", "upload" or
+            "notify", i.e. the chunk has been uploaded, but cached data might not have been invalidated) and error
+            message.
+        started (datetime): Start of the ingest.
+        finished (datetime): End of the ingest.
+    """
+
+    formats = dict(nt="nt", nq="nquads", ttl="turtle")
+
+    validations = ["rdflib", "syntax", "none"]
+
+    # subject, predicate, object and (in N-Quads) graph label of a statement
+    triple_pattern = re.compile(
+        r'[ \t]*(' + IRIREF + '|' + BLANK_NODE_LABEL + r')[ \t]*(' + IRIREF + r')[ \t]*(' + IRIREF + '|'
+        + BLANK_NODE_LABEL + '|' + LITERAL + r')[ \t]*\.[ \t]*(?:#.*)?'
+    )
+    quad_pattern = re.compile(
+        r'[ \t]*(' + IRIREF + '|' + BLANK_NODE_LABEL + r')[ \t]*(' + IRIREF + r')[ \t]*(' + IRIREF + '|'
+        + BLANK_NODE_LABEL + '|' + LITERAL + r')[ \t]*(' + IRIREF + '|' + BLANK_NODE_LABEL + r')?[ \t]*\.[ \t]*'
+        r'(?:#.*)?'
+    )
+
+    rdf_type = str(RDF.type)
+
+    # numeric escape sequences in IRIs
+    uchar_pattern = re.compile(r'\\u([0-9A-Fa-f]{4})|\\U([0-9A-Fa-f]{8})')
+
+    # directives of Turtle
+    directive_pattern = re.compile(r'@prefix\b|@base\b|(?i:prefix|base)\s')
+
+    def __init__(self, database: DB, graph: str = None, format: str = "nt", chunk_size: int = 50000,
+                 validation: str = "rdflib", processes: int = 1, uploads: int = 1, progress=None):
+        """Initialize the ingest.
+
+        Args:
+            database (DB): Triple Store connection of class DB.
+            graph (str, optional): Name of the named graph.
+            format (str): Format of the data: "nt", "nq" or "ttl". Defaults to "nt".
+            chunk_size (int): Maximum number of statements per chunk. Defaults to 50000.
+            validation (str): Validation mode: "rdflib", "syntax" or "none". Defaults to "rdflib".
+            processes (int): Number of processes that check the chunks. Defaults to 1.
+            uploads (int): Number of chunks that are uploaded at the same time. Defaults to 1.
+            progress (optional): Function that is called with the status after each chunk.
+        """
+        if format not in self.formats:
+            raise Exception("Chunked ingest is not implemented for format " + str(format))
+
+        if validation not in self.validations:
+            raise Exception("Unknown validation mode " + str(validation))
+
+        self.database = database
+        self.graph = graph
+        self.format = format
+        self.chunk_size = chunk_size
+        self.validation = validation
+        self.processes = max(1, processes)
+        self.uploads = max(1, uploads)
+        self.progress = progress
+
+        self.statements = 0
+        self.chunks = 0
+        self.bytes = 0
+        self.failures = []
+        self.started = None
+        self.finished = None
+
+        # the chunks are processed by several threads, see __run_parallel()
+        self.__lock = threading.Lock()
+
+    def run(self, lines) -> bool:
+        """Read the data and upload it chunk by chunk.
+
+        Args:
+            lines: Iterable of the lines of the data (bytes), e.g. a file opened in binary mode or the stream of a
+                request.
+
+        Returns:
+            bool: True if all chunks have been uploaded.
+        """
+        self.started = datetime.now(timezone.utc)
+
+        if self.format == "ttl":
+            chunks = self.__turtle_chunks(lines)
+        else:
+            chunks = self.__line_chunks(lines)
+
+        if self.processes > 1 or self.uploads > 1:
+            self.__run_parallel(chunks)
+        else:
+            for chunk in chunks:
+                self.__process(chunk)
+
+        if self.validation == "none" and self.statements:
+            # the uploaded resources are not known; N-Quads can be loaded into several graphs
+            self.database.notify("upload", graph=self.graph if self.format != "nq" else None)
+
+        self.finished = datetime.now(timezone.utc)
+        return not self.failures
+
+    def __line_chunks(self, lines):
+        """Split N-Triples or N-Quads into chunks of lines.
+
+        Yields:
+            tuple: Number of the chunk, data (bytes), first and last line and number of statements.
+        """
+        number = 0
+        chunk = []
+        first_line = 1
+        line_number = 0
+        # after the first blank node label, the rest of the data is sent as one chunk (might also be in a literal)
+        blank_nodes = False
+        for line in lines:
+            line_number += 1
+            self.bytes += len(line)
+
+            # blank lines and comments are not statements
+            stripped = line.strip()
+            if not stripped or stripped.startswith(b"#"):
+                if not chunk:
+                    first_line = line_number + 1
+                continue
+
+            if not line.endswith(b"\n"):
+                line += b"\n"
+            chunk.append(line)
+            blank_nodes = blank_nodes or b"_:" in line
+
+            if len(chunk) >= self.chunk_size and not blank_nodes:
+                number += 1
+                yield number, b"".join(chunk), first_line, line_number, len(chunk)
+                chunk = []
+                first_line = line_number + 1
+
+        if chunk:
+            number += 1
+            yield number, b"".join(chunk), first_line, line_number, len(chunk)
+
+    def __turtle_chunks(self, lines):
+        """Split Turtle at the ends of statements.
+
+        The directives (@prefix, @base, PREFIX and BASE) are collected in a pre-pass over each line and put in front
+        of every following chunk, so that each chunk can be parsed on its own.
+
+        Yields:
+            tuple: Number of the chunk, data (bytes), first and last line and number of statements.
+        """
+        number = 0
+        directives = []
+        chunk = []
+        statements = 0
+        first_line = 1
+        line_number = 0
+        # state of the current statement: delimiter of an open long string and depth of brackets
+        in_statement = False
+        quote = None
+        depth = 0
+        # after the first blank node label, the rest of the data is sent as one chunk (might also be in a literal)
+        blank_nodes = False
+        for line in lines:
+            line_number += 1
+            self.bytes += len(line)
+
+            if not line.endswith(b"\n"):
+                line += b"\n"
+            text = line.decode("utf-8")
+
+            if not in_statement:
+                stripped = text.strip()
+                if not stripped or stripped.startswith("#"):
+                    if not chunk:
+                        first_line = line_number + 1
+                    continue
+
+                if self.directive_pattern.match(stripped):
+                    # directives are written on a single line
+                    directives.append(line)
+                    if not chunk:
+                        first_line = line_number + 1
+                    continue
+
+            in_statement = True
+            quote, depth, last = self.scan_turtle(text, quote, depth)
+            chunk.append(line)
+            blank_nodes = blank_nodes or b"_:" in line
+
+            if quote is None and depth <= 0 and last == ".":
+                # end of the statement
+                in_statement = False
+                depth = 0
+                statements += 1
+
+                if statements >= self.chunk_size and not blank_nodes:
+                    number += 1
+                    yield number, b"".join(directives + chunk), first_line, line_number, statements
+                    chunk = []
+                    statements = 0
+                    first_line = line_number + 1
+
+        if chunk:
+            number += 1
+            yield number, b"".join(directives + chunk), first_line, line_number, statements
+
+    def __run_parallel(self, chunks):
+        """Parse the chunks in a pool of processes and upload them in a pool of threads.
+
+        The number of chunks that are held in memory at the same time is bounded.
+        """
+        if self.processes > 1 and not (self.validation == "none" and self.format == "nt"):
+            # new processes are spawned, forking a process with running threads is not safe
+            parsers = ProcessPoolExecutor(max_workers=self.processes, mp_context=multiprocessing.get_context("spawn"))
+        else:
+            parsers = None
+        uploaders = ThreadPoolExecutor(max_workers=self.uploads, thread_name_prefix="ingest-upload")
+
+        pending = deque()
+        max_pending = 2 * max(self.processes, self.uploads)
+        try:
+            for chunk in chunks:
+                if parsers is not None:
+                    number, data, first_line, last_line, statements = chunk
+                    parsed = parsers.submit(ChunkedIngest.prepare, data, self.format, self.validation, self.graph)
+                else:
+                    parsed = None
+                pending.append(uploaders.submit(self.__process, chunk, parsed))
+
+                while len(pending) >= max_pending:
+                    pending.popleft().result()
+
+            while pending:
+                pending.popleft().result()
+
+        finally:
+            uploaders.shutdown()
+            if parsers is not None:
+                parsers.shutdown()
+
+    def __process(self, chunk: tuple, parsed: Future = None):
+        """Check and upload a chunk, record a failure.
+
+        Args:
+            chunk (tuple): Number of the chunk, data (bytes), first and last line and number of statements.
+            parsed (Future, optional): Result of prepare(), if the chunk is parsed in another process.
+        """
+        number, data, first_line, last_line, statements = chunk
+        stage = "parse"
+        try:
+            if parsed is None:
+                graphs = self.prepare(data, self.format, self.validation, self.graph)
+            else:
+                graphs = parsed.result()
+
+            stage = "upload"
+            for graph, payload, uris, types in graphs:
+                self.database.upload_data(payload, graph=graph)
+
+            with self.__lock:
+                self.statements += statements
+
+            # the data has been uploaded: a failure of the invalidation is not an upload failure
+            stage = "notify"
+            for graph, payload, uris, types in graphs:
+                if uris is not None:
+                    self.database.notify("upload", graph=graph, uris=uris, types=types)
+
+        except Exception as exception:
+            with self.__lock:
+                self.failures.append(dict(
+                    chunk=number,
+                    firstLine=first_line,
+                    lastLine=last_line,
+                    stage=stage,
+                    error=str(exception)
+                ))
+
+        with self.__lock:
+            self.chunks += 1
+            status = self.status()
+
+        if self.progress is not None:
+            self.progress(status)
+
+    @staticmethod
+    def prepare(data: bytes, format: str, validation: str, graph: str = None) -> list:
+        """Check a chunk and prepare it for the upload.
+
+        A static method, so that it can be run in another process.
+
+        Args:
+            data (bytes): Chunk.
+            format (str): Format of the data: "nt", "nq" or "ttl".
+            validation (str): Validation mode: "rdflib", "syntax" or "none".
+            graph (str, optional): Name of the target graph.
+
+        Returns:
+            list: Name of the target graph, data to upload (bytes), URIs and classes of the resources (None, if not
+                known) per graph.
+        """
+        if format == "ttl":
+            if validation == "none":
+                return [(graph, data, None, None)]
+            # there is no line based check of Turtle
+            return ChunkedIngest.parse(data, format, graph)
+
+        if validation == "rdflib":
+            return ChunkedIngest.parse(data, format, graph)
+        elif validation == "none" and format == "nt":
+            return [(graph, data, None, None)]
+        else:
+            return ChunkedIngest.check(data, format, validation, graph)
+
+    @staticmethod
+    def parse(data: bytes, format: str, graph: str = None) -> list:
+        """Parse a chunk with rdflib.
+
+        Returns:
+            list: Name of the target graph, data to upload (bytes), URIs and classes of the resources per graph.
+        """
+        content = data.decode("utf-8")
+
+        if format in ("nt", "ttl"):
+            g = Graph()
+            g.parse(data=content, format=ChunkedIngest.formats[format])
+            uris, types = DB.get_resources(g)
+            if format == "ttl":
+                # send the parsed triples, the directives of the chunk are not needed anymore
+                data = g.serialize(format="nt", encoding="utf-8")
+            return [(graph, data, uris, types)]
+
+        dataset = ConjunctiveGraph()
+        dataset.parse(data=content, format=ChunkedIngest.formats[format])
+
+        graphs = []
+        for context in dataset.contexts():
+            if len(context) == 0:
+                continue
+
+            identifier = context.identifier
+            if isinstance(identifier, BNode) or identifier == DATASET_DEFAULT_GRAPH_ID \
+                    or identifier == dataset.default_context.identifier:
+                context_graph = graph
+            else:
+                context_graph = str(identifier)
+
+            payload = context.serialize(format="nt", encoding="utf-8")
+            uris, types = DB.get_resources(context)
+            graphs.append((context_graph, payload, uris, types))
+
+        return graphs
+
+    @staticmethod
+    def check(data: bytes, format: str, validation: str, graph: str = None) -> list:
+        """Check the syntax of a chunk of N-Triples or N-Quads line by line, without building a graph.
+
+        Returns:
+            list: Name of the target graph, data to upload (bytes), URIs and classes of the resources per graph.
+        """
+        if format == "nt":
+            pattern = ChunkedIngest.triple_pattern
+        else:
+            pattern = ChunkedIngest.quad_pattern
+
+        # graph label -> [lines, uris, types]; N-Triples have no graph labels and keep the original data
+        graphs = dict()
+        # split at line feeds only: literals may contain other line separators, e.g. U+2028
+        for line in data.decode("utf-8").split("\n"):
+            line = line.rstrip("\r")
+            match = pattern.fullmatch(line)
+            if match is None:
+                if line.strip() and not line.lstrip().startswith("#"):
+                    raise Exception("Invalid statement: " + line[:200])
+                continue
+
+            subject, predicate, obj = match.group(1, 2, 3)
+            if format == "nq":
+                label = match.group(4)
+                if label is not None and not label.startswith("<"):
+                    # graphs labeled with blank nodes are loaded into the target graph
+                    label = None
+                entry = graphs.setdefault(label, [[], set(), set()])
+                entry[0].append(subject + " " + predicate + " " + obj + " .\n")
+            else:
+                entry = graphs.setdefault(None, [None, set(), set()])
+
+            if validation == "none":
+                continue
+
+            if subject.startswith("<"):
+                entry[1].add(ChunkedIngest.unescape_iri(subject))
+            if obj.startswith("<"):
+                uri = ChunkedIngest.unescape_iri(obj)
+                entry[1].add(uri)
+                if ChunkedIngest.unescape_iri(predicate) == ChunkedIngest.rdf_type:
+                    entry[2].add(uri)
+
+        checked = []
+        for label, (lines, uris, types) in graphs.items():
+            if label is None:
+                target = graph
+            else:
+                target = ChunkedIngest.unescape_iri(label)
+
+            if lines is None:
+                payload = data
+            else:
+                payload = "".join(lines).encode("utf-8")
+
+            if validation == "none":
+                # the uploaded resources are not known, see run()
+                uris = None
+
+            checked.append((target, payload, uris, types))
+
+        return checked
+
+    @staticmethod
+    def unescape_iri(iri: str) -> str:
+        """Get the IRI of an IRIREF of N-Triples or N-Quads: strip the angle brackets and resolve escape sequences.
+
+        Args:
+            iri (str): IRIREF, e.g. "<http://example.org/caf\\u00E9>".
+
+        Returns:
+            str: IRI, e.g. "http://example.org/café".
+        """
+        iri = iri[1:-1]
+        if "\\" not in iri:
+            return iri
+        return ChunkedIngest.uchar_pattern.sub(lambda match: chr(int(match.group(1) or match.group(2), 16)), iri)
+
+    @staticmethod
+    def scan_turtle(line: str, quote: str = None, depth: int = 0) -> tuple:
+        """Scan a line of Turtle to find the end of a statement.
+
+        Strings, IRIs and comments are skipped, brackets are counted. A statement ends with a line whose last
+        character (outside of strings and comments) is a dot, if no long string and no bracket is open.
+
+        Args:
+            line (str): Line of Turtle.
+            quote (str, optional): Delimiter of a long string (three double or single quotes) that is open at the
+                beginning of the line.
+            depth (int): Number of open brackets at the beginning of the line.
+
+        Returns:
+            tuple: Long string that is open at the end of the line (or None), number of open brackets and the last
+                character of the line outside of strings and comments.
+        """
+        last = None
+        position = 0
+        length = len(line)
+        while position < length:
+            character = line[position]
+
+            if quote:
+                if character == "\\":
+                    position += 2
+                elif line.startswith(quote, position):
+                    position += len(quote)
+                    quote = None
+                    last = character
+                else:
+                    position += 1
+                continue
+
+            if character == '"' or character == "'":
+                if line.startswith(character * 3, position):
+                    quote = character * 3
+                else:
+                    quote = character
+                position += len(quote)
+                continue
+
+            if character == "#":
+                break
+
+            if character == "<":
+                end = line.find(">", position)
+                if end != -1:
+                    position = end + 1
+                    last = ">"
+                    continue
+
+            if character in "[(":
+                depth += 1
+            elif character in "])":
+                depth -= 1
+
+            if not character.isspace():
+                last = character
+            position += 1
+
+        if quote is not None and len(quote) == 1:
+            # short strings end with the line; the error is reported by the parser
+            quote = None
+
+        return quote, depth, last
+
+    def status(self) -> dict:
+        """Get the progress of the ingest.
+
+        Returns:
+            dict: Format, target graph, numbers of statements, chunks, bytes and failed chunks, start and end, and
+                the failed chunks.
+        """
+        status = dict(
+            format=self.format,
+            graph=self.graph,
+            statements=self.statements,
+            chunks=self.chunks,
+            bytes=self.bytes,
+            failed=len(self.failures),
+            started=self.started.isoformat() if self.started else None,
+            finished=self.finished.isoformat() if self.finished else None,
+            failures=self.failures
+        )
+        return status
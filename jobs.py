@@ -0,0 +1,364 @@
+"""Module to load data into the Triple Store in the background
+
+The data of an upload is spooled to local disk and loaded by a bounded pool of threads, so that the request that
+submitted the data does not need to wait and large uploads do not tie up the threads that serve the read endpoints.
+"""
+from sparql import DB
+from ingest import ChunkedIngest
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import json
+import os
+import shutil
+import re
+import threading
+import uuid
+
+
+class QueueFullError(Exception):
+    """Raised by IngestQueue.submit(), if too many jobs are waiting to be loaded."""
+
+
+class IngestJob:
+    """Upload of data that is loaded in the background.
+
+    Attributes:
+        id (str): ID of the job.
+        path (str): Path of the spooled data. Removed when the job is finished.
+        graph (str): Name of the named graph.
+        format (str): Format of the data: "ttl", "nt" or "nq".
+        validation (str): Validation mode, see ChunkedIngest.
+        size (int): Size of the data in bytes.
+        state (str): State of the job: "queued", "running", "done" or "failed".
+        created (datetime): Time the job has been submitted.
+        started (datetime): Start of the load.
+        finished (datetime): End of the load.
+        error (str): Error message, if the job failed.
+        ingest (ChunkedIngest): Progress of the data that is loaded in chunks. Defaults to None.
+    """
+
+    def __init__(self, path: str, graph: str = None, format: str = "ttl", validation: str = None, size: int = 0):
+        """Initialize the job.
+
+        Args:
+            path (str): Path of the spooled data. Can be set when the ID of the job is known.
+            graph (str, optional): Name of the named graph.
+            format (str): Format of the data: "ttl", "nt" or "nq". Defaults to "ttl".
+            validation (str, optional): Validation mode, see ChunkedIngest.
+            size (int): Size of the data in bytes.
+        """
+        self.id = uuid.uuid4().hex
+        self.path = path
+        self.graph = graph
+        self.format = format
+        self.validation = validation
+        self.size = size
+        self.state = "queued"
+        self.created = datetime.now(timezone.utc)
+        self.started = None
+        self.finished = None
+        self.error = None
+        self.ingest = None
+
+    def status(self) -> dict:
+        """Get the status of the job.
+
+        Returns:
+            dict: ID, state, format, graph, size, times, error message, progress and throughput (statements and bytes
+                per second) of the job. Progress and throughput are only known for data that is loaded in chunks.
+        """
+        status = dict(
+            id=self.id,
+            state=self.state,
+            format=self.format,
+            graph=self.graph,
+            validation=self.validation,
+            size=self.size,
+            created=self.created.isoformat(),
+            started=self.started.isoformat() if self.started else None,
+            finished=self.finished.isoformat() if self.finished else None,
+            error=self.error
+        )
+
+        ingest = self.ingest
+        if ingest is not None:
+            status["statements"] = ingest.statements
+            status["chunks"] = ingest.chunks
+            status["bytes"] = ingest.bytes
+            status["failed"] = len(ingest.failures)
+            status["failures"] = list(ingest.failures)
+
+            if self.started:
+                seconds = ((self.finished or datetime.now(timezone.utc)) - self.started).total_seconds()
+                if seconds > 0:
+                    status["statementsPerSecond"] = round(ingest.statements / seconds, 1)
+                    status["bytesPerSecond"] = round(ingest.bytes / seconds, 1)
+
+        return status
+
+
+class IngestQueue:
+    """Queue of ingest jobs, loaded by a bounded pool of threads.
+
+    The status of each job is also written to the spool directory, so that it can be read by all processes of the
+    service (e.g. the workers of the pre-fork server) that share the directory. Each process has its own queue and pool
+    of threads: with several worker processes, "workers" and "max_queued" are multiplied by the number of processes.
+    Jobs that were not finished when the service stopped are marked as failed by recover(), when the service starts.
+
+    Attributes:
+        database (DB): Triple Store connection of class DB.
+        directory (str): Spool directory of the data and the status of the jobs.
+        workers (int): Number of jobs that are loaded at the same time.
+        max_queued (int): Maximum number of jobs that wait to be loaded. Further jobs are rejected.
+        max_jobs (int): Number of jobs that are kept in memory (and in the spool directory) after they are finished.
+        chunk_size (int): Maximum number of statements per chunk, see ChunkedIngest.
+        processes (int): Number of processes that parse the chunks of a job. If greater than 1, Turtle is loaded in
+            chunks, too (see ChunkedIngest).
+        uploads (int): Number of chunks of a job that are uploaded at the same time.
+    """
+
+    # files of the jobs in the spool directory: ID of the job and ".json" (status) or ".data" (spooled data)
+    file_pattern = re.compile(r'[0-9a-f]{32}\.(json|data)')
+
+    def __init__(self, database: DB, directory: str, workers: int = 1, max_queued: int = 10, max_jobs: int = 100,
+                 chunk_size: int = 50000, processes: int = 1, uploads: int = 1):
+        """Initialize the queue.
+
+        Args:
+            database (DB): Triple Store connection of class DB.
+            directory (str): Spool directory. Created when the first job is submitted.
+            workers (int): Number of jobs that are loaded at the same time. Defaults to 1.
+            max_queued (int): Maximum number of waiting jobs. Defaults to 10.
+            max_jobs (int): Number of finished jobs that are kept. Defaults to 100.
+            chunk_size (int): Maximum number of statements per chunk. Defaults to 50000.
+            processes (int): Number of processes that parse the chunks of a job. Defaults to 1.
+            uploads (int): Number of chunks of a job that are uploaded at the same time. Defaults to 1.
+        """
+        self.database = database
+        self.directory = directory
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_jobs = max_jobs
+        self.chunk_size = chunk_size
+        self.processes = processes
+        self.uploads = uploads
+
+        # job id -> IngestJob, in the order of submission
+        self.__jobs = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ingest")
+
+    def after_fork(self) -> bool:
+        """Set up a new pool of threads in a forked worker process; threads are not copied to the child process.
+
+        Returns:
+            bool: True if successful.
+        """
+        self.__jobs = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ingest")
+        return True
+
+    @staticmethod
+    def recover(directory: str) -> int:
+        """Clean up the spool directory after the service has been stopped, e.g. when it starts.
+
+        Jobs that are still queued or running are marked as failed and their spooled data is removed. Must not be
+        called while a process of the service loads jobs from the directory. Other files in the directory are kept.
+
+        Args:
+            directory (str): Spool directory.
+
+        Returns:
+            int: Number of jobs that have been marked as failed.
+        """
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return 0
+
+        failed = 0
+        for name in names:
+            match = IngestQueue.file_pattern.fullmatch(name)
+            if match is None:
+                continue
+
+            path = os.path.join(directory, name)
+            try:
+                if match.group(1) == "data":
+                    # no job is loaded yet: the data is orphaned
+                    os.remove(path)
+                    continue
+
+                with open(path, "r") as f:
+                    status = json.load(f)
+                if status.get("state") not in ("queued", "running"):
+                    continue
+
+                status["state"] = "failed"
+                status["finished"] = datetime.now(timezone.utc).isoformat()
+                status["error"] = "The service has been stopped before the job was finished."
+                temporary_path = path + ".tmp"
+                with open(temporary_path, "w") as f:
+                    json.dump(status, f)
+                os.replace(temporary_path, path)
+                failed += 1
+
+            except (OSError, ValueError, AttributeError):
+                continue
+
+        return failed
+
+    def accepts(self) -> bool:
+        """Check whether a new job can be submitted: less than "max_queued" jobs are waiting."""
+        with self.__lock:
+            return self.__queued() < self.max_queued
+
+    def submit(self, stream, graph: str = None, format: str = "ttl", validation: str = None) -> IngestJob:
+        """Spool data to disk and queue a job to load it.
+
+        Args:
+            stream: File-like object with the data (bytes), e.g. the stream of a request.
+            graph (str, optional): Name of the named graph.
+            format (str): Format of the data: "ttl", "nt" or "nq". Defaults to "ttl".
+            validation (str, optional): Validation mode, see ChunkedIngest.
+
+        Returns:
+            IngestJob: The queued job or None, if the data is empty.
+
+        Raises:
+            QueueFullError: Too many jobs are waiting, see accepts().
+        """
+        job = IngestJob(None, graph=graph, format=format, validation=validation)
+        # the data is spooled next to the status file of the job
+        job.path = os.path.join(self.directory, job.id + ".data")
+
+        # the job takes its place in the queue while the data is spooled, so that concurrent uploads can't exceed it
+        with self.__lock:
+            if self.__queued() >= self.max_queued:
+                raise QueueFullError("Too many ingest jobs are waiting.")
+            self.__jobs[job.id] = job
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(job.path, "wb") as f:
+                shutil.copyfileobj(stream, f, 1024 * 1024)
+                job.size = f.tell()
+
+            if job.size == 0:
+                os.remove(job.path)
+
+        except:
+            with self.__lock:
+                self.__jobs.pop(job.id, None)
+            try:
+                os.remove(job.path)
+            except OSError:
+                pass
+            raise
+
+        with self.__lock:
+            if job.size == 0:
+                self.__jobs.pop(job.id, None)
+                return None
+            self.__evict()
+
+        self.__write_status(job)
+        self.__executor.submit(self.__run, job)
+        return job
+
+    def get(self, job_id: str) -> dict:
+        """Get the status of a job.
+
+        Jobs of other processes are read from the spool directory.
+
+        Args:
+            job_id (str): ID of the job.
+
+        Returns:
+            dict: Status of the job (see IngestJob.status()) or None, if the job is unknown.
+        """
+        with self.__lock:
+            job = self.__jobs.get(job_id)
+        if job is not None:
+            return job.status()
+
+        # the ID is used as file name; only accept IDs that IngestJob creates
+        if len(job_id) != 32 or not all(character in "0123456789abcdef" for character in job_id):
+            return None
+
+        try:
+            with open(self.__status_path(job_id), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def __run(self, job: IngestJob):
+        """Load the data of a job. Runs in a thread of the pool."""
+        job.state = "running"
+        job.started = datetime.now(timezone.utc)
+        self.__write_status(job)
+
+        try:
+            # Turtle is only split, if it is parsed in parallel
+            if job.format != "ttl" or self.processes > 1:
+                job.ingest = ChunkedIngest(self.database, graph=job.graph, format=job.format,
+                                           chunk_size=self.chunk_size, validation=job.validation or "syntax",
+                                           processes=self.processes, uploads=self.uploads,
+                                           progress=lambda status: self.__write_status(job))
+                with open(job.path, "rb") as f:
+                    job.ingest.run(f)
+                if job.ingest.failures:
+                    job.error = str(len(job.ingest.failures)) + " chunks could not be loaded."
+            else:
+                with open(job.path, "rb") as f:
+                    data = f.read()
+                self.database.upload(data, graph=job.graph, format=job.format, validate=job.validation != "none")
+
+            if job.error:
+                job.state = "failed"
+            else:
+                job.state = "done"
+
+        except Exception as exception:
+            job.state = "failed"
+            job.error = str(exception)
+
+        finally:
+            job.finished = datetime.now(timezone.utc)
+            try:
+                os.remove(job.path)
+            except OSError:
+                pass
+            self.__write_status(job)
+
+    def __status_path(self, job_id: str) -> str:
+        """Get the path of the status file of a job."""
+        return os.path.join(self.directory, job_id + ".json")
+
+    def __write_status(self, job: IngestJob):
+        """Write the status of a job to the spool directory. Errors are ignored."""
+        path = self.__status_path(job.id)
+        # the chunks of a job might be uploaded by several threads
+        temporary_path = path + "." + str(threading.get_ident()) + ".tmp"
+        try:
+            with open(temporary_path, "w") as f:
+                json.dump(job.status(), f)
+            os.replace(temporary_path, path)
+        except OSError:
+            pass
+
+    def __queued(self) -> int:
+        """Get the number of jobs that wait to be loaded. Must be called with the lock held."""
+        return sum(1 for job in self.__jobs.values() if job.state == "queued")
+
+    def __evict(self):
+        """Remove the oldest finished jobs, if more than "max_jobs" are kept. Must be called with the lock held."""
+        finished = [job for job in self.__jobs.values() if job.state in ("done", "failed")]
+        for job in finished[:max(0, len(self.__jobs) - self.max_jobs)]:
+            del self.__jobs[job.id]
+            try:
+                os.remove(self.__status_path(job.id))
+            except OSError:
+                pass
@@ -66,3 +66,13 @@ class CorpusSchema(Schema):
     repository = fields.Str(required=False)
     metrics = fields.Nested(CorpusMetricsSchema, required=False)
     characters = fields.Nested(CharacterSchema, required=False)
+
+
+class LoadingStatusSchema(Schema):
+    """Status of the loading of the corpora"""
+    state = fields.Str(validate=validate.OneOf(["idle", "running", "done", "failed"]))
+    started = fields.DateTime(allow_none=True)
+    finished = fields.DateTime(allow_none=True)
+    error = fields.Str(allow_none=True)
+    corpora = fields.Int()
+    interval = fields.Float(allow_none=True)
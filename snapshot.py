@@ -0,0 +1,141 @@
+"""Module to store the loaded corpora on disk
+
+A snapshot file is a SQLite database with the metadata and metrics of all corpora and their stored characters. It is
+written after the corpora have been loaded and read when the service starts, so that the corpora can be served right
+away, while they are loaded from the Triple Store in the background (see CorporaLoader).
+"""
+from corpora import Corpora
+from corpus import Corpus
+from character import Character
+from sparql import DB
+from datetime import datetime, timezone
+import json
+import os
+import sqlite3
+import threading
+
+
+class SnapshotFile:
+    """Snapshot of the loaded corpora in a SQLite database.
+
+    The file is replaced as a whole when it is written, readers never see a half-written snapshot. Files of another
+    format version are ignored.
+
+    Attributes:
+        path (str): Path of the file.
+        format_version (int): Version of the layout of the file. Change it when the layout or the state of Corpus or
+            Character (see Corpus.get_state()) changes.
+    """
+
+    format_version = 2
+
+    def __init__(self, path: str):
+        """Initialize the snapshot file.
+
+        Args:
+            path (str): Path of the file. The directory is created when the file is written.
+        """
+        self.path = path
+
+    def write(self, corpora: Corpora) -> bool:
+        """Write the corpora to the file.
+
+        Args:
+            corpora (Corpora): Loaded corpora.
+
+        Returns:
+            bool: True if successful.
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+
+        # write to a temporary file first; several processes (e.g. workers of the server) might write at once
+        temporary_path = self.path + "." + str(os.getpid()) + "." + str(threading.get_ident()) + ".tmp"
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+        connection = sqlite3.connect(temporary_path)
+        try:
+            connection.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+            connection.execute("CREATE TABLE corpora (id TEXT PRIMARY KEY, state TEXT)")
+            connection.execute("CREATE TABLE characters (corpus_id TEXT, id TEXT, state TEXT, "
+                               "PRIMARY KEY (corpus_id, id))")
+
+            meta = dict(
+                format_version=str(self.format_version),
+                fingerprint=corpora.fingerprint or "",
+                created=datetime.now(timezone.utc).isoformat()
+            )
+            connection.executemany("INSERT INTO meta VALUES (?, ?)", meta.items())
+
+            for corpus_id, corpus in corpora.corpora.items():
+                connection.execute("INSERT INTO corpora VALUES (?, ?)", (corpus_id, json.dumps(corpus.get_state())))
+                # keep a reference, the characters might be reset in the meantime
+                characters = corpus.characters
+                if characters:
+                    connection.executemany(
+                        "INSERT INTO characters VALUES (?, ?, ?)",
+                        ((corpus_id, character_id, json.dumps(character.get_state()))
+                         for character_id, character in characters.items())
+                    )
+
+            connection.commit()
+        finally:
+            connection.close()
+
+        os.replace(temporary_path, self.path)
+        return True
+
+    def read(self, database: DB = None) -> Corpora:
+        """Read the corpora from the file.
+
+        No queries are sent. The restored corpora are marked with the flag "restored".
+
+        Args:
+            database (DB, optional): Triple Store connection of class DB, set on the restored corpora and characters.
+
+        Returns:
+            Corpora: Restored corpora or None, if there is no (readable) snapshot of the current format version.
+        """
+        if not os.path.exists(self.path):
+            return None
+
+        try:
+            connection = sqlite3.connect("file:" + self.path + "?mode=ro", uri=True)
+        except sqlite3.Error:
+            return None
+
+        try:
+            meta = dict(connection.execute("SELECT key, value FROM meta"))
+            if meta.get("format_version") != str(self.format_version):
+                return None
+
+            corpora = dict()
+            for corpus_id, state in connection.execute("SELECT id, state FROM corpora ORDER BY rowid"):
+                corpus = Corpus()
+                corpus.set_state(json.loads(state))
+                corpus.database = database
+                corpora[corpus_id] = corpus
+
+            for corpus_id, character_id, state in connection.execute(
+                    "SELECT corpus_id, id, state FROM characters ORDER BY rowid"):
+                corpus = corpora.get(corpus_id)
+                if corpus is None:
+                    continue
+                character = Character()
+                character.set_state(json.loads(state))
+                character.database = database
+                if corpus.characters is None:
+                    corpus.characters = dict()
+                corpus.characters[character_id] = character
+
+        except (sqlite3.Error, ValueError, KeyError):
+            return None
+
+        finally:
+            connection.close()
+
+        snapshot = Corpora(corpora=corpora, database=database)
+        snapshot.fingerprint = meta.get("fingerprint") or None
+        snapshot.restored = True
+        return snapshot
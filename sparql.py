@@ -1,11 +1,527 @@
 """Module to document and handle SPARQL Queries
 """
-from SPARQLWrapper import SPARQLWrapper, JSON
-from rdflib import Graph
+from rdflib import Graph, URIRef, RDF
+from collections import OrderedDict
+import codecs
+import fcntl
+import json
+import os
+import re
+import threading
+import time
+import uuid
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPDigestAuth
 
 
+class QueryCache:
+    """Cache of SPARQL results in front of DB.sparql().
+
+    Results are stored with the final query string (see SparqlQuery.dump()) as key. Each entry expires after a
+    time to live (TTL), which can be set per query class. If the estimated size of all entries exceeds the memory
+    budget, the least recently used entries are evicted. The cache is safe to be used from multiple threads.
+
+    Cached results are shared between callers and must be treated as read-only.
+
+    Attributes:
+        max_size (int): Memory budget in bytes. The size of an entry is estimated from the length of the values.
+        default_ttl (float): TTL in seconds of entries of query classes without a specific TTL.
+        ttls (dict): TTLs in seconds by name of the query class, e.g. {"CorpusCharactersUriIdName": 3600}.
+            Overrides the class attribute "cache_ttl" of the query. A TTL of 0 disables caching for a query class.
+        size (int): Estimated size of all entries in bytes.
+        hits (int): Number of lookups that returned a cached result.
+        misses (int): Number of lookups that did not find a (valid) result.
+        evictions (int): Number of entries that were removed to stay within the memory budget.
+        invalidations (int): Number of entries that were removed because the data in the Triple Store changed.
+    """
+
+    # estimated overhead in bytes of a single value object of a binding, e.g. {'type': 'literal', 'value': '...'}
+    value_overhead = 250
+
+    def __init__(self, max_size: int = 64 * 1024 * 1024, default_ttl: float = 300, ttls: dict = None):
+        """Initialize the cache.
+
+        Args:
+            max_size (int): Memory budget in bytes. Defaults to 64 MB.
+            default_ttl (float): Default TTL in seconds. Defaults to 300.
+            ttls (dict, optional): TTLs in seconds by name of the query class.
+        """
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+
+        if ttls:
+            self.ttls = ttls
+        else:
+            self.ttls = dict()
+
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        # query -> (results, expiry timestamp, estimated size, uris); order of the items is the order of the last use
+        self.__entries = OrderedDict()
+
+        # uri -> queries of the entries that depend on this uri; entries without uris depend on any change
+        self.__index = dict()
+        self.__global = set()
+
+        self.__lock = threading.Lock()
+
+    def after_fork(self) -> bool:
+        """Replace the lock in a forked worker process; it might have been held by another thread of the parent.
+
+        Returns:
+            bool: True if successful.
+        """
+        self.__lock = threading.Lock()
+        return True
+
+    def get_ttl(self, query) -> float:
+        """Get the TTL for a query.
+
+        Args:
+            query (SparqlQuery): Instance of a SPARQL query class.
+
+        Returns:
+            float: TTL in seconds. 0 means, that results of this query are not cached.
+        """
+        query_class = type(query).__name__
+        if query_class in self.ttls:
+            return self.ttls[query_class]
+        elif query.cache_ttl is not None:
+            return query.cache_ttl
+        else:
+            return self.default_ttl
+
+    def estimate_size(self, query: str, sparql_results: dict) -> int:
+        """Estimate the memory used by a cache entry.
+
+        Args:
+            query (str): Query string (key of the entry).
+            sparql_results (dict): Results in SPARQL results format.
+
+        Returns:
+            int: Estimated size in bytes.
+        """
+        size = len(query)
+        for binding in sparql_results["results"]["bindings"]:
+            for value_item in binding.values():
+                size += self.value_overhead + len(value_item["value"])
+        return size
+
+    def get(self, query: str):
+        """Get cached results of a query.
+
+        Args:
+            query (str): Query string.
+
+        Returns:
+            dict: Results in SPARQL results format or None, if there are no (valid) results.
+        """
+        with self.__lock:
+            entry = self.__entries.get(query)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            sparql_results, expires, size, uris = entry
+            if expires < time.monotonic():
+                # expired, remove the entry
+                self.__remove(query)
+                self.misses += 1
+                return None
+
+            # mark as recently used
+            self.__entries.move_to_end(query)
+            self.hits += 1
+            return sparql_results
+
+    def __remove(self, query: str):
+        """Remove an entry. Must be called with the lock held."""
+        sparql_results, expires, size, uris = self.__entries.pop(query)
+        self.size -= size
+
+        if uris:
+            for uri in uris:
+                queries = self.__index.get(uri)
+                if queries is not None:
+                    queries.discard(query)
+                    if not queries:
+                        del self.__index[uri]
+        else:
+            self.__global.discard(query)
+
+    def set(self, query: str, sparql_results: dict, ttl: float = None, uris: list = None) -> bool:
+        """Store results of a query.
+
+        The entry depends on the URIs injected into the query and on all URIs in the results: it is removed by
+        invalidate() if one of them is affected by a change. Entries of queries without injected URIs, e.g. lists of
+        all corpora, are removed on any change.
+
+        Args:
+            query (str): Query string.
+            sparql_results (dict): Results in SPARQL results format.
+            ttl (float, optional): TTL in seconds. Defaults to "default_ttl".
+            uris (list, optional): URIs injected into the query. Values of class SparqlLiteral are ignored.
+
+        Returns:
+            bool: True if the results have been cached.
+        """
+        if ttl is None:
+            ttl = self.default_ttl
+
+        if ttl <= 0:
+            return False
+
+        size = self.estimate_size(query, sparql_results)
+        if size > self.max_size:
+            # would evict everything else and still not fit
+            return False
+
+        # values injected into the query that are not URIs (e.g. string literals or numbers) are not indexed
+        if uris:
+            uris = [uri for uri in uris if not isinstance(uri, SparqlLiteral)]
+
+        if uris:
+            entry_uris = set(uris)
+            for binding in sparql_results["results"]["bindings"]:
+                for value_item in binding.values():
+                    if value_item["type"] == "uri":
+                        entry_uris.add(value_item["value"])
+        else:
+            entry_uris = None
+
+        with self.__lock:
+            if query in self.__entries:
+                self.__remove(query)
+
+            self.__entries[query] = (sparql_results, time.monotonic() + ttl, size, entry_uris)
+            self.size += size
+
+            if entry_uris:
+                for uri in entry_uris:
+                    self.__index.setdefault(uri, set()).add(query)
+            else:
+                self.__global.add(query)
+
+            # evict the least recently used entries until the cache fits into the memory budget again
+            while self.size > self.max_size:
+                self.__remove(next(iter(self.__entries)))
+                self.evictions += 1
+
+        return True
+
+    def invalidate(self, uris: set = None) -> int:
+        """Remove entries that are affected by a change of the data.
+
+        Args:
+            uris (set, optional): URIs affected by the change. If None, all entries are removed.
+
+        Returns:
+            int: Number of removed entries.
+        """
+        with self.__lock:
+            if uris is None:
+                queries = set(self.__entries.keys())
+            else:
+                # entries that don't depend on specific uris are always affected
+                queries = set(self.__global)
+                for uri in uris:
+                    if uri in self.__index:
+                        queries.update(self.__index[uri])
+
+            for query in queries:
+                self.__remove(query)
+
+            self.invalidations += len(queries)
+
+        return len(queries)
+
+    def clear(self) -> bool:
+        """Remove all entries.
+
+        Returns:
+            bool: True if successful.
+        """
+        with self.__lock:
+            self.__entries.clear()
+            self.__index.clear()
+            self.__global.clear()
+            self.size = 0
+        return True
+
+    def stats(self) -> dict:
+        """Get counters of the cache.
+
+        Returns:
+            dict: Number of entries, estimated size, hits, misses and evictions.
+        """
+        with self.__lock:
+            return dict(
+                entries=len(self.__entries),
+                size=self.size,
+                max_size=self.max_size,
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                invalidations=self.invalidations
+            )
+
+
+class SparqlJsonStream:
+    """Incremental parser of the SPARQL results JSON format.
+
+    see https://www.w3.org/TR/sparql11-results-json/
+
+    Reads a response chunk by chunk: the variables in the head are parsed when the parser is initialized, the
+    solutions in "results.bindings" are parsed one by one by the generator bindings(). Only the current chunk and
+    the current solution are kept in memory. This requires the head to precede the results, as serialized by
+    Virtuoso. Otherwise, the bindings have to be parsed before the head and are kept in memory.
+
+    Attributes:
+        vars (list): Variables in the head of the results.
+        chunk_size (int): Size of the chunks to read from a response in bytes.
+    """
+
+    chunk_size = 64 * 1024
+
+    # the buffer is trimmed when this many characters have been consumed
+    trim_size = 1024 * 1024
+
+    vars = None
+
+    def __init__(self, chunks):
+        """Initialize the parser and parse the head.
+
+        Args:
+            chunks: Iterable of the response body in chunks (bytes), e.g. requests.Response.iter_content().
+        """
+        self.__chunks = iter(chunks)
+        self.__decoder = codecs.getincrementaldecoder("utf-8")()
+        self.__json = json.JSONDecoder()
+        self.__buffer = ""
+        self.__pos = 0
+
+        # bindings that had to be parsed before the head
+        self.__parsed_bindings = None
+
+        if self.__find_first(['"vars"', '"bindings"']) == '"bindings"':
+            # the results precede the head: can't stream
+            self.__find("[")
+            self.__parsed_bindings = list(self.__array_items())
+            self.__find('"vars"')
+
+        self.__find(":")
+        self.vars = self.__decode_value()
+
+    def __read(self) -> bool:
+        """Read the next chunk into the buffer.
+
+        Returns:
+            bool: False if there is no more data.
+        """
+        # drop the part of the buffer that has been consumed already
+        if self.__pos > self.trim_size:
+            self.__buffer = self.__buffer[self.__pos:]
+            self.__pos = 0
+
+        for chunk in self.__chunks:
+            if chunk:
+                self.__buffer += self.__decoder.decode(chunk)
+                return True
+
+        self.__buffer += self.__decoder.decode(b"", final=True)
+        return False
+
+    def __find_first(self, tokens: list) -> str:
+        """Move the position to the end of the next occurrence of one of the tokens.
+
+        Returns:
+            str: The token that has been found.
+        """
+        while True:
+            found = None
+            for token in tokens:
+                index = self.__buffer.find(token, self.__pos)
+                if index >= 0 and (found is None or index < found[0]):
+                    found = (index, token)
+            if found:
+                self.__pos = found[0] + len(found[1])
+                return found[1]
+            # keep the end of the buffer, a token might be split between two chunks
+            self.__pos = max(self.__pos, len(self.__buffer) - max(len(token) for token in tokens) + 1)
+            if not self.__read():
+                raise Exception("Could not parse SPARQL results: " + " or ".join(tokens) + " is missing.")
+
+    def __find(self, token: str):
+        """Move the position to the end of the next occurrence of a token."""
+        self.__find_first([token])
+
+    def __next_character(self) -> str:
+        """Skip whitespace and get the next character. Returns an empty string at the end of the data."""
+        while True:
+            while self.__pos < len(self.__buffer) and self.__buffer[self.__pos] in " \t\r\n":
+                self.__pos += 1
+            if self.__pos < len(self.__buffer):
+                return self.__buffer[self.__pos]
+            if not self.__read():
+                return ""
+
+    def __decode_value(self):
+        """Decode the JSON value (object or array) at the current position, reading more data if incomplete."""
+        self.__next_character()
+        while True:
+            try:
+                value, end = self.__json.raw_decode(self.__buffer, self.__pos)
+                self.__pos = end
+                return value
+            except json.JSONDecodeError:
+                # incomplete value, read more
+                if not self.__read():
+                    raise Exception("Could not parse SPARQL results: incomplete data.")
+
+    def bindings(self):
+        """Parse the solutions in "results.bindings".
+
+        Yields:
+            dict: A single binding, e.g. {'Name': {'type': 'literal', 'value': 'Juana Ines de La Cruz'}}
+        """
+        if self.__parsed_bindings is not None:
+            yield from self.__parsed_bindings
+            return
+
+        self.__find('"bindings"')
+        self.__find("[")
+        yield from self.__array_items()
+
+    def __array_items(self):
+        """Parse the items of the array at the current position (after the opening bracket) one by one."""
+        while True:
+            character = self.__next_character()
+            if character == "]":
+                return
+            elif character == ",":
+                self.__pos += 1
+            elif character == "":
+                raise Exception("Could not parse SPARQL results: incomplete data.")
+            else:
+                yield self.__decode_value()
+
+
+class StreamedBindings:
+    """Iterator of the solutions of a streamed response, see DB.sparql().
+
+    The response keeps its pooled connection and its slot of the concurrent requests to the Triple Store until
+    release() is called: when the solutions are exhausted, parsing fails, the iterator is closed or it is garbage
+    collected, e.g. if it has never been iterated. Releasing is idempotent and safe to be called from any thread.
+    """
+
+    def __init__(self, bindings, release):
+        """Initialize the iterator.
+
+        Args:
+            bindings: Generator of the solutions, e.g. SparqlJsonStream.bindings().
+            release: Function that closes the response and frees the slot. Called exactly once.
+        """
+        self.__bindings = bindings
+        self.__release = release
+        self.__lock = threading.Lock()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> dict:
+        try:
+            return next(self.__bindings)
+        except BaseException:
+            # exhausted (StopIteration) or failed
+            self.close()
+            raise
+
+    def close(self):
+        """Stop reading the response and release the connection."""
+        with self.__lock:
+            release = self.__release
+            self.__release = None
+
+        if release is not None:
+            try:
+                self.__bindings.close()
+            finally:
+                release()
+
+    def __del__(self):
+        self.close()
+
+
+class ChangeCounter:
+    """Counter of the changes of the data in the Triple Store, shared by the processes of the service in a file.
+
+    Each process of the service (e.g. each worker of the pre-fork server) has its own cached query results and
+    corpora. After a process has changed the data, it increments the counter (see DB.notify()); the other processes
+    compare the counter with the last state they have seen and invalidate their data (see DB.synchronize()).
+
+    The file contains a random ID, which is created with the file, and the counter. The ID tells apart the counters of
+    a file that has been removed and created again, e.g. in a temporary directory.
+
+    Attributes:
+        path (str): Path of the file. All processes that serve data of the same Triple Store must use the same file.
+    """
+
+    def __init__(self, path: str):
+        """Initialize the counter.
+
+        Args:
+            path (str): Path of the file. The file and its directory are created with the first change.
+        """
+        self.path = path
+
+    def read(self) -> str:
+        """Get the current state of the counter. Reads the file, the state is not cached.
+
+        Returns:
+            str: ID of the file and counter, e.g. "3f0c...:12", or an empty string if there is no (valid) file.
+        """
+        try:
+            with open(self.path, "r") as f:
+                file_id, count = f.read().split()
+            return file_id + ":" + str(int(count))
+        except (OSError, ValueError):
+            return ""
+
+    def increment(self) -> tuple:
+        """Increment the counter.
+
+        Returns:
+            tuple: State of the counter (see read()) before and after the increment.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+        # processes (and threads) increment the counter one after another
+        with open(self.path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                previous = self.read()
+                if previous:
+                    file_id, count = previous.split(":")
+                else:
+                    file_id, count = uuid.uuid4().hex, 0
+                count = int(count) + 1
+
+                # replace the file as a whole, readers never see a half-written counter
+                temporary_path = self.path + "." + str(os.getpid()) + ".tmp"
+                with open(temporary_path, "w") as f:
+                    f.write(file_id + " " + str(count))
+                os.replace(temporary_path, self.path)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+        return previous, file_id + ":" + str(count)
+
+
 class DB:
     """TripleStore to query against. Need to be initialized with the information needed for a connection.
 
@@ -19,6 +535,23 @@ class DB:
         sparql_query_endpoint (str): URL of the SPARQL endpoint.
         sparql_auth_endpoint (str): URL of the endpoint that is used for authorized queries, e.g. SPARQL UPDATE.
         crud_endpoint (str): URL of the endpoint that allows for uploading.
+        pool_size (int): Maximum number of keep-alive connections kept open to the Triple Store.
+        max_in_flight (int): Maximum number of requests that are sent to the Triple Store at the same time. At most
+            "pool_size": each request holds a pooled connection, streamed queries until their results are read.
+        pool_timeout (float): Seconds to wait for a free slot (and connection) before a request fails. None waits
+            indefinitely.
+        adapter (HTTPAdapter): Pooled HTTP transport shared by queries, uploads and deletes.
+        session (requests.Session): Session of the current thread. All sessions use the shared adapter.
+        cache (QueryCache): Cache of query results. Used by SparqlQuery.execute(). Defaults to None (no caching).
+        listeners (list): Functions that are called with an event (dict) after data has been changed by upload() or
+            delete_graph(). See method notify().
+        changes (ChangeCounter): Counter of the changes, shared with the other processes of the service. Defaults to
+            None (a single process).
+        generation (str): State of the data that this process has seen: the state of the shared counter of changes
+            (see synchronize()) or, without it, a random value that is replaced with each change. Is the same in all
+            processes that have seen the same changes, e.g. to compute ETags.
+        auth (HTTPDigestAuth): Digest authentication used for uploads and deletes. The instance is reused, so that
+            the nonce of the server's challenge can be reused for subsequent requests.
     """
     def __init__(
             self,
@@ -28,6 +561,11 @@ class DB:
             port: str = "8890",
             username: str = None,
             password: str = None,
+            pool_size: int = 10,
+            max_in_flight: int = None,
+            pool_timeout: float = 30,
+            cache: QueryCache = None,
+            changes: ChangeCounter = None,
     ):
         """Initialize the Database Connection.
 
@@ -38,6 +576,13 @@ class DB:
             port (str): Port of the Triple Store. Defaults to stardog's default port "8890".
             username (str): Username of the Triple Store. Defaults to None.
             password (str): Password of the Triple Store User. Defaults to None.
+            pool_size (int): Maximum number of keep-alive connections kept open to the Triple Store. Defaults to 10.
+            max_in_flight (int): Maximum number of concurrent requests to the Triple Store. Further requests wait
+                until a slot is free. Defaults to the pool size, larger values are reduced to it.
+            pool_timeout (float): Seconds to wait for a free slot before a request fails. Defaults to 30.
+            cache (QueryCache, optional): Cache of query results. Defaults to None (no caching).
+            changes (ChangeCounter, optional): Counter of the changes, shared by the processes of the service. Needed
+                if several processes serve the data, see synchronize(). Defaults to None.
         """
         self.triplestore = triplestore
         self.protocol = protocol
@@ -45,6 +590,32 @@ class DB:
         self.port = port
         self.username = username
         self.password = password
+        self.pool_size = pool_size
+        self.pool_timeout = pool_timeout
+        self.cache = cache
+        self.listeners = []
+        self.changes = changes
+
+        if self.changes is not None:
+            self.generation = self.changes.read()
+        else:
+            self.generation = uuid.uuid4().hex
+
+        # threads that see a change of another process wait until the data has been invalidated
+        self.__synchronizing = threading.Lock()
+
+        if max_in_flight:
+            self.max_in_flight = min(max_in_flight, pool_size)
+        else:
+            self.max_in_flight = pool_size
+
+        # bounds the number of requests that are executed concurrently, e.g. by the threads of the flask app. A
+        # request that holds a slot always gets a connection of the (blocking) pool, so waiting is bounded by
+        # "pool_timeout" (see __acquire())
+        self.__in_flight = threading.BoundedSemaphore(self.max_in_flight)
+
+        # each thread gets its own session (see property "session"), so no request state is shared between threads
+        self.__local = threading.local()
 
         # Settings for virtuoso
         if self.triplestore == "virtuoso":
@@ -52,9 +623,9 @@ class DB:
             # set the url of the SPARQL endpoint
             self.sparql_query_endpoint = protocol + "://" + url + ":" + port + "/sparql"
 
-            # set the connection with sparqlwrapper package
-            self.conn = SPARQLWrapper(self.sparql_query_endpoint)
-            self.conn.setReturnFormat(JSON)
+            # set up a pooled HTTP transport: connections are kept alive and reused by queries, uploads and deletes.
+            # The connection pool is thread-safe and shared by the sessions of all threads.
+            self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, pool_block=True)
 
             # if username and password are provided, set the endpoints for uploading and SPARQL UPDATE
             if self.username and self.password:
@@ -64,40 +635,250 @@ class DB:
                 # set the url of the sparql-graph-crud-auth endpoint
                 self.crud_endpoint = protocol + "://" + url + ":" + port + "/sparql-graph-crud-auth"
 
+                # a single instance, because it keeps the nonce of the last digest challenge
+                self.auth = HTTPDigestAuth(self.username, self.password)
+
             else:
                 self.sparql_auth_endpoint = None
                 self.crud_endpoint = None
+                self.auth = None
 
         else:
             raise Exception("No implementation for triple store " + self.triplestore)
 
-    def sparql(self, query: str):
+    @property
+    def session(self) -> requests.Session:
+        """Session of the current thread.
+
+        The session is created on first use and mounts the shared (pooled) adapter.
+        """
+        session = getattr(self.__local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount(self.protocol + "://", self.adapter)
+            self.__local.session = session
+        return session
+
+    def after_fork(self) -> bool:
+        """Set up a new connection pool in a forked worker process.
+
+        Sockets of the pool, sessions and the state of the semaphore must not be shared with the parent process,
+        e.g. if the app is loaded before the workers of a pre-fork server are forked. Cached query results are kept,
+        so the worker starts with a warm cache.
+
+        Returns:
+            bool: True if successful.
+        """
+        self.__in_flight = threading.BoundedSemaphore(self.max_in_flight)
+        self.__local = threading.local()
+        self.__synchronizing = threading.Lock()
+        if self.cache is not None:
+            self.cache.after_fork()
+        if self.triplestore == "virtuoso":
+            self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, pool_block=True)
+        return True
+
+    def __acquire(self):
+        """Wait for a slot of the concurrent requests to the Triple Store. Release it with __in_flight.release().
+
+        Raises:
+            Exception: No slot became free within "pool_timeout" seconds.
+        """
+        if not self.__in_flight.acquire(timeout=self.pool_timeout):
+            raise Exception("Triple Store is busy: no connection available within " + str(self.pool_timeout) +
+                            " seconds.")
+
+    def add_listener(self, listener) -> bool:
+        """Register a function that is called after the data in the Triple Store has been changed.
+
+        Args:
+            listener: Function that accepts an event (dict), see method notify().
+
+        Returns:
+            bool: True if successful.
+        """
+        self.listeners.append(listener)
+        return True
+
+    def notify(self, action: str, graph: str = None, uris: set = None, types: set = None) -> bool:
+        """Publish an invalidation event after the data in the Triple Store has been changed.
+
+        Cached query results that are affected are removed from the cache, then the listeners are called with the
+        event, a dictionary with the keys "action", "graph", "uris" and "types". Finally, the shared counter of
+        changes is incremented, so that the other processes of the service invalidate their data (see synchronize()).
+
+        The URIs of the event contain all URIs (subjects and objects) of the changed triples and their parent URIs,
+        e.g. ".../C000000001/character_name" also affects ".../C000000001", because the nodes of an entity use
+        the URI of the entity as prefix.
+
+        Args:
+            action (str): Type of the change: "upload" or "delete".
+            graph (str, optional): Name of the named graph that has been changed.
+            uris (set, optional): URIs used in the changed triples. None means, that any data could be affected.
+            types (set, optional): Classes (rdf:type) of the changed resources.
+
+        Returns:
+            bool: True if successful.
+        """
+        # apply the changes of other processes first: the counter is then only incremented by this change
+        self.synchronize()
+
+        if uris is not None:
+            affected_uris = set()
+            for uri in uris:
+                # add the uri and its parents, e.g. http://a.b/c/d -> http://a.b/c/d, http://a.b/c
+                while uri not in affected_uris:
+                    affected_uris.add(uri)
+                    parent = uri.rsplit("/", 1)[0]
+                    if parent.endswith("/") or "/" not in parent:
+                        break
+                    uri = parent
+        else:
+            affected_uris = None
+
+        event = dict(action=action, graph=graph, uris=affected_uris, types=types)
+
+        if self.cache is not None:
+            self.cache.invalidate(affected_uris)
+
+        for listener in self.listeners:
+            listener(event)
+
+        with self.__synchronizing:
+            if self.changes is None:
+                self.generation = uuid.uuid4().hex
+                return True
+
+            try:
+                previous, current = self.changes.increment()
+            except OSError:
+                # the other processes can't be notified; change the state of this process at least
+                self.generation = uuid.uuid4().hex
+                return True
+
+            # if another process has changed the data in the meantime, the state is left as it is: the next
+            # synchronize() will invalidate all data
+            if previous == self.generation:
+                self.generation = current
+
+        return True
+
+    def synchronize(self) -> bool:
+        """Invalidate the data of this process, if another process of the service has changed the Triple Store.
+
+        Compares the shared counter of changes (see ChangeCounter) with the state that this process has seen. If it
+        has changed, all cached query results are removed and the listeners are called with an event that affects all
+        data (action "synchronize"), because the changes are not known. Only one thread handles a change. The
+        listeners are called after the lock has been released and must not wait for queries, because they delay a
+        request (e.g. schedule a load in the background instead). Should be called before each request is handled;
+        reading the counter is cheap.
+
+        Returns:
+            bool: True if the data has been invalidated.
+        """
+        if self.changes is None or self.changes.read() == self.generation:
+            return False
+
+        with self.__synchronizing:
+            # another thread might have invalidated the data in the meantime
+            generation = self.changes.read()
+            if generation == self.generation:
+                return False
+
+            if self.cache is not None:
+                self.cache.invalidate()
+
+            self.generation = generation
+
+        event = dict(action="synchronize", graph=None, uris=None, types=None)
+        for listener in self.listeners:
+            listener(event)
+
+        return True
+
+    def sparql(self, query: str, stream: bool = False):
         """
         Send a SPARQL Query.
+
+        Safe to be called from multiple threads: each call sends its own request and at most "max_in_flight"
+        queries are executed at the same time.
+
+        In streaming mode, the response is parsed incrementally (see SparqlJsonStream): "results.bindings" of the
+        returned dictionary is an iterator (see StreamedBindings), that yields the solutions while they are read from
+        the connection. It can only be iterated once. The connection and the slot of the query are held until the
+        iterator is exhausted, closed or garbage collected.
+
+        Args:
+            query (str): SPARQL query.
+            stream (bool): Stream the results. Defaults to False.
+
+        Returns:
+            dict: Results in SPARQL results format.
         """
         # only implemented for virtuoso
         if self.triplestore == "virtuoso":
-            # use sparqlwrapper to set the query and execute it on the connection
-            self.conn.setQuery(query)
-            results = self.conn.queryAndConvert()
-            return results
+            # send the query with the pooled session (SPARQL protocol, form-encoded POST)
+            self.__acquire()
+            try:
+                response = self.session.post(url=self.sparql_query_endpoint, data={"query": query},
+                                             headers={"Accept": "application/sparql-results+json"}, stream=stream)
+            except:
+                self.__in_flight.release()
+                raise
+
+            if not stream:
+                # the body has been read, the connection is back in the pool
+                self.__in_flight.release()
+                if response.status_code != 200:
+                    raise Exception("Server returned status code: " + str(response.status_code))
+                return response.json()
+
+            # a streamed response holds its connection (and slot) until it has been read
+            in_flight = self.__in_flight
+
+            def release():
+                response.close()
+                in_flight.release()
+
+            try:
+                if response.status_code != 200:
+                    raise Exception("Server returned status code: " + str(response.status_code))
+                parser = SparqlJsonStream(response.iter_content(chunk_size=SparqlJsonStream.chunk_size))
+            except:
+                release()
+                raise
+
+            bindings = StreamedBindings(parser.bindings(), release)
+            return {"head": {"vars": parser.vars}, "results": {"bindings": bindings}}
 
         # if not using virtuoso, we throw an exception because this is not implemented yet
         else:
             raise Exception("No implementation for triple store " + self.triplestore)
 
-    def upload(self, content: str, graph: str = None, format: str = "ttl"):
+    def upload(self, content: str, graph: str = None, format: str = "ttl", validate: bool = True):
         """Upload RDF data into triple store.
 
         see also https://www.w3.org/TR/sparql11-http-rdf-update/
 
+        After a successful upload, an invalidation event with the URIs of the uploaded triples is published
+        (see method notify()). Large files should be uploaded in chunks, see module "ingest".
+
         Args:
             content (str): Triples to upload.
             graph (str): Name of the named graph. Defaults to "None".
             format (str): Format of the content provided. Defaults to "ttl".
+            validate (bool): Parse the data before it is uploaded. If False, the content is sent as it is (must be
+                Turtle or N-Triples) and the invalidation event affects all data. Defaults to True.
         """
 
         if self.triplestore == "virtuoso":
+            if not validate:
+                if isinstance(content, str):
+                    content = content.encode(encoding='utf-8')
+                self.upload_data(content, graph=graph)
+                self.notify("upload", graph=graph)
+                return True
+
             # check the data by parsing it with rdflib. Should be valid RDF at least.
             try:
                 g = Graph()
@@ -109,23 +890,51 @@ class DB:
             ttl_content = g.serialize(format="ttl")
             data = ttl_content.encode(encoding='utf-8')
 
-            if self.crud_endpoint:
-                if graph:
-                    request_url = self.crud_endpoint + "?graph=" + graph
-                else:
-                    request_url = self.crud_endpoint
-            else:
+            self.upload_data(data, graph=graph)
+
+            # publish the change: uris of subjects and objects and the classes of the uploaded resources
+            uris, types = self.get_resources(g)
+            self.notify("upload", graph=graph, uris=uris, types=types)
+
+            return True
+
+        else:
+            raise Exception("No implementation for triple store " + self.triplestore)
+
+    def upload_data(self, data: bytes, graph: str = None, content_type: str = "application/x-turtle") -> bool:
+        """Send serialized RDF data to the triple store as it is.
+
+        The data is not checked and no invalidation event is published, see upload() and the module "ingest".
+
+        Args:
+            data (bytes): Serialized RDF data, e.g. Turtle encoded as UTF-8. N-Triples are valid Turtle.
+            graph (str): Name of the named graph. Defaults to "None".
+            content_type (str): Media type of the data. Defaults to "application/x-turtle".
+
+        Returns:
+            bool: True if successful.
+        """
+        if self.triplestore == "virtuoso":
+            if not self.crud_endpoint:
                 raise Exception("Upload URL is not set.")
 
-            # send the request
-            if self.username and self.password:
-                response = requests.post(url=request_url, data=data, auth=HTTPDigestAuth(self.username, self.password),
-                                         headers={'Content-Type': 'application/x-turtle'})
+            # the name of the graph is encoded by requests, it can contain e.g. "#" or "&"
+            if graph:
+                params = {"graph": graph}
             else:
-                # this will probably never work, but maybe the Triple Store is set that it accepts anonymous uploads
-                response = requests.post(url=request_url, data=data, headers={'Content-Type': 'application/x-turtle'})
+                params = None
 
-            if response.status_code == 201 or response.status_code == 201:
+            # send the request; if there are no credentials (self.auth is None) this will probably never work,
+            # but maybe the Triple Store is set that it accepts anonymous uploads
+            self.__acquire()
+            try:
+                response = self.session.post(url=self.crud_endpoint, params=params, data=data, auth=self.auth,
+                                             headers={'Content-Type': content_type})
+            finally:
+                self.__in_flight.release()
+
+            # 201: the graph has been created, 200 or 204: the data has been added to an existing graph
+            if response.status_code in (200, 201, 204):
                 return True
             elif response.status_code == 401:
                 raise Exception("Server declined upload due to missing/wrong credentials.")
@@ -135,24 +944,50 @@ class DB:
         else:
             raise Exception("No implementation for triple store " + self.triplestore)
 
+    @staticmethod
+    def get_resources(g: Graph) -> tuple:
+        """Get the URIs (subjects and objects) and the classes (rdf:type) of the resources in a graph.
+
+        Used to publish invalidation events after data has been uploaded, see notify().
+
+        Args:
+            g (Graph): Uploaded triples.
+
+        Returns:
+            tuple: URIs (set) and classes (set).
+        """
+        uris = set()
+        for subject, predicate, obj in g:
+            if isinstance(subject, URIRef):
+                uris.add(str(subject))
+            if isinstance(obj, URIRef):
+                uris.add(str(obj))
+        types = set(str(obj) for obj in g.objects(predicate=RDF.type))
+        return uris, types
+
     def delete_graph(self, graph: str):
         """Delete a named graph
 
+        After the graph has been deleted, an invalidation event is published (see method notify()). Because the
+        deleted triples are not known, it affects all data.
+
         Args:
             graph (str): Name of a named graph.
         """
 
         if self.triplestore == "virtuoso":
+            if not self.crud_endpoint:
+                raise Exception("Upload URL is not set.")
 
-            request_url = self.crud_endpoint + "?graph=" + graph
-
-            if self.username and self.password:
-                response = requests.delete(url=request_url, auth=HTTPDigestAuth(self.username, self.password))
-            else:
-                # this will probably never work, but maybe the Triple Store is set that it accepts anonymous delete
-                response = requests.delete(url=request_url)
+            # this will probably never work without credentials, but maybe the Triple Store accepts anonymous delete
+            self.__acquire()
+            try:
+                response = self.session.delete(url=self.crud_endpoint, params={"graph": graph}, auth=self.auth)
+            finally:
+                self.__in_flight.release()
 
             if response.status_code == 200:
+                self.notify("delete", graph=graph)
                 return True
             else:
                 raise Exception("Server returned status code: " + str(response.status_code))
@@ -160,6 +995,110 @@ class DB:
             raise Exception("No implementation for triple store " + self.triplestore)
 
 
+class SparqlLiteral(str):
+    """Value injected into a query template that is not an URI, e.g. a string literal or a number.
+
+    Created with SparqlTemplate.literal() and SparqlTemplate.integer(). Such values are not used to index cached
+    results by URI (see QueryCache.set()).
+    """
+    __slots__ = ()
+
+
+class SparqlTemplate:
+    """Compiled SPARQL query template.
+
+    The template is split once at the placeholders (e.g. $1, $2), the prefix declarations are rendered and put in
+    front of the first part. Binding URIs then produces the final query string with a single join. Instances are
+    immutable and can be shared across threads.
+
+    Attributes:
+        parts (tuple): Parts of the template between the placeholders. The first part starts with the prefix
+            declarations.
+        positions (tuple): Index of the URI (in the list of URIs to be bound) for each placeholder.
+        placeholders (tuple): Placeholders as they occur in the template, e.g. "$1".
+        includes_variables (bool): Flag that indicates that there are placeholders in the template.
+    """
+
+    __slots__ = ("parts", "positions", "placeholders", "includes_variables")
+
+    def __init__(self, template: str, prefixes: list = None, uri_inject_prefix: str = "$"):
+        """Compile a template.
+
+        Args:
+            template (str): SPARQL query or query template.
+            prefixes (list, optional): Prefixes that need to be defined at the beginning of the query. They are
+                not added, if the template already contains prefix declarations.
+            uri_inject_prefix (str): Prefix of the placeholders. Defaults to "$".
+        """
+        split = re.split("(" + re.escape(uri_inject_prefix) + r"(\d+))", template)
+        parts = split[0::3]
+        placeholders = split[1::3]
+        positions = [int(n) - 1 for n in split[2::3]]
+
+        if prefixes and "PREFIX" not in template:
+            prefix_declarations = []
+            for prefix_item in prefixes:
+                prefix_declarations.append("PREFIX " + prefix_item["prefix"] + ": <" + prefix_item["uri"].strip() + ">")
+            parts[0] = "\n".join(prefix_declarations) + parts[0]
+
+        object.__setattr__(self, "parts", tuple(parts))
+        object.__setattr__(self, "positions", tuple(positions))
+        object.__setattr__(self, "placeholders", tuple(placeholders))
+        object.__setattr__(self, "includes_variables", len(positions) > 0)
+
+    def __setattr__(self, name, value):
+        raise Exception("SparqlTemplate is immutable.")
+
+    def bind(self, uris: list = None) -> str:
+        """Get the query with the URIs injected.
+
+        Args:
+            uris (list, optional): URIs to inject: the placeholder $1 is replaced with the first URI, $2 with the
+                second. Placeholders without a corresponding URI are kept.
+
+        Returns:
+            str: Query.
+        """
+        if not self.includes_variables:
+            return self.parts[0]
+
+        if uris is None:
+            uris = []
+        count = len(uris)
+
+        pieces = [self.parts[0]]
+        for position, placeholder, part in zip(self.positions, self.placeholders, self.parts[1:]):
+            pieces.append(uris[position] if 0 <= position < count else placeholder)
+            pieces.append(part)
+
+        return "".join(pieces)
+
+    @staticmethod
+    def literal(value: str) -> SparqlLiteral:
+        """Get a string as SPARQL string literal, e.g. to inject a value that is not an URI into a template.
+
+        Args:
+            value (str): Value.
+
+        Returns:
+            SparqlLiteral: Quoted string literal with backslashes, quotes and line breaks escaped.
+        """
+        escaped = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n").replace("\r", "\\r")
+        return SparqlLiteral('"' + escaped + '"')
+
+    @staticmethod
+    def integer(value: int) -> SparqlLiteral:
+        """Get an integer to inject into a template, e.g. as LIMIT or OFFSET.
+
+        Args:
+            value (int): Value.
+
+        Returns:
+            SparqlLiteral: The integer.
+        """
+        return SparqlLiteral(str(int(value)))
+
+
 class SparqlQuery:
     """SPARQL Query.
 
@@ -184,6 +1123,11 @@ class SparqlQuery:
             e.g. "stardog" would hint that the query will work with a stardog implementation
             (because of a special union graph that is only available with this triple store).
         variables (list, optional): Variables. If the query uses any, they should be specified.
+        uris (list, optional): URIs that have been injected into the query (see method inject()).
+        compiled (SparqlTemplate): Template (or query) and prefixes of the class, compiled when the class is defined.
+            Instances that use the template of their class bind the URIs with it instead of preparing the query.
+        cache_ttl (float, optional): Time to live in seconds of cached results of this query (see QueryCache).
+            Defaults to None, which uses the default TTL of the cache. 0 disables caching of the results.
     """
 
     # State of the query
@@ -213,6 +1157,18 @@ class SparqlQuery:
     # results of the query:
     results = None
 
+    # uris injected into the query
+    uris = None
+
+    # time to live of cached results; None uses the default of the cache
+    cache_ttl = None
+
+    # template (or query) of the class compiled with the prefixes, see __init_subclass__()
+    compiled = None
+
+    # query bound with the compiled template: as long as the query is this one, inject() uses the compiled template
+    __compiled_query = None
+
     # Flags:
 
     # Flag that indicates if prefixes have been injected into the query
@@ -288,6 +1244,16 @@ class SparqlQuery:
         if variables:
             self.variables = variables
 
+        if self.compiled is not None and not (query or template or prefixes):
+            # the query is defined by the class: use the compiled template instead of preparing the query
+            self.__bind(uris)
+
+            if execute is True and self.state == "prepared" and self.query_includes_variables is False \
+                    and database is not None:
+                self.execute(database)
+
+            return
+
         # prepare the "query" if a template and prefixes are provided
         if self.prefixes and self.template:
             self.prepare()
@@ -325,6 +1291,41 @@ class SparqlQuery:
             if self.state == "prepared" and self.query_includes_variables is False and database is not None:
                 self.execute(database)
 
+    def __init_subclass__(cls, **kwargs):
+        """Compile the template (or query) of a query class with its prefixes once, when the class is defined."""
+        super().__init_subclass__(**kwargs)
+
+        if cls.template or cls.query:
+            cls.compiled = SparqlTemplate(cls.template or cls.query, prefixes=cls.prefixes,
+                                          uri_inject_prefix=cls.uri_inject_prefix)
+        else:
+            cls.compiled = None
+
+    def __bind(self, uris: list = None):
+        """Set the query by binding URIs with the compiled template of the class.
+
+        Args:
+            uris (list, optional): URIs to inject into the query.
+        """
+        self.query = self.compiled.bind(uris)
+        self.__compiled_query = self.query
+        self.query_includes_prefixes = True
+
+        if uris is not None and self.compiled.includes_variables:
+            self.uris = uris
+            self.query_includes_variables = False
+        else:
+            self.query_includes_variables = self.compiled.includes_variables
+
+        if self.template:
+            self.template_includes_variables = self.compiled.includes_variables
+
+        # a template is prepared even if it still contains variables (same as prepare()), a query is not
+        if self.template or self.query_includes_variables is False:
+            self.state = "prepared"
+        else:
+            self.state = "new"
+
     def get_prefix_uri(self, prefix: str) -> str:
         """Get the uri for a prefix form self.prefixes"""
         if self.prefixes:
@@ -429,6 +1430,12 @@ class SparqlQuery:
         Returns:
             bool: True if operation was successful.
         """
+        # query of the class, that has not been changed: bind the uris with the compiled template
+        if self.__compiled_query is not None and self.compiled.includes_variables and \
+                (target == "template" or (self.query is self.__compiled_query and self.query_includes_variables)):
+            self.__bind(uris)
+            return True
+
         # uses the query template: but doesn't inject into the template but overwrites self.query
         if self.template and target == "template":
             prepared_query = self.template
@@ -443,8 +1450,9 @@ class SparqlQuery:
             prepared_query = prepared_query.replace(to_replace, uri)
             n = n + 1
 
-        # store the prepared query
+        # store the prepared query and the injected uris
         self.query = prepared_query
+        self.uris = uris
 
         # set the state of the query to "prepared", but only, if prefixes are already included.
         if self.query_includes_prefixes is True:
@@ -506,13 +1514,18 @@ class SparqlQuery:
         """
         return self.query
 
-    def execute(self, database: DB) -> bool:
+    def execute(self, database: DB, stream: bool = False) -> bool:
         """Execute a query.
 
-        Will store the results of the query in self.results.
+        Will store the results of the query in self.results. If the database has a cache (see QueryCache),
+        cached results are used.
+
+        In streaming mode, the bindings of the results are parsed while they are iterated, e.g. with
+        SparqlResults.iter_simplify(). They can only be iterated once. Streamed results are not added to the cache.
 
         Args:
             database: Instance of the class "DB". Expects to be able to use the method
+            stream (bool): Stream the results. Defaults to False.
 
         Returns:
             bool: True indicates that the operation was successful.
@@ -522,8 +1535,18 @@ class SparqlQuery:
             # can only run if we have a query, the prefixes are included (should be done by prepare())
             # and there are no variables in the query
             if self.state == "prepared" and self.query_includes_variables is False:
-                # use the sparql method of the supplied database
-                sparql_results = database.sparql(self.query)
+                # use cached results, if the database has a cache, otherwise the sparql method of the database
+                if database.cache is not None:
+                    sparql_results = database.cache.get(self.query)
+                    if sparql_results is None and stream:
+                        sparql_results = database.sparql(self.query, stream=True)
+                    elif sparql_results is None:
+                        sparql_results = database.sparql(self.query)
+                        database.cache.set(self.query, sparql_results, ttl=database.cache.get_ttl(self),
+                                           uris=self.uris)
+                else:
+                    sparql_results = database.sparql(self.query, stream=stream)
+
                 # use SparqlResults class that provide methods to handle the returned SPARQL results json format
                 self.results = SparqlResults(sparql_results)
 
@@ -553,12 +1576,26 @@ class SparqlResults:
     # Bindings
     bindings = None
 
+    # Converters of the datatypes that can be used in a mapping
+    datatype_converters = {
+        "str": str,
+        "String": str,
+        "int": int,
+        "Integer": int
+    }
+
+    # Converters of typed literals, used if there is no explicit mapping
+    xsd_converters = {
+        "http://www.w3.org/2001/XMLSchema#int": int
+    }
+
     def __init__(self, sparql_results: dict):
         """Initialize
 
         Args:
             sparql_results: Response returned by a SPARQL query in SPARQL results format
                 see https://www.w3.org/TR/sparql11-results-json/
+                The bindings can also be a generator (streaming mode of DB.sparql()).
         """
 
         # store the data
@@ -572,56 +1609,69 @@ class SparqlResults:
         """Return the stored SPARQL results in SPARQL Results Format"""
         return self.data
 
-    def __get_solution_variable_value(self,
-                                      key: str,
-                                      value_item: dict,
-                                      mapping: dict = None):
-        """Get the value of a variable in a query solution (in a binding).
+    def compile_mapping(self, mapping: dict = None) -> list:
+        """Compile a mapping into a table of converters, one per variable.
+
+        The mapping and the types are evaluated once per variable, not for every value. An explicit datatype in
+        the mapping has priority over the type of the value object. Without an explicit datatype, the "type" of
+        the value object is evaluated: URIs and literals are returned as strings, typed literals of a datatype
+        in "xsd_converters" are converted.
 
         Args:
-            key (str): Key of a variable in a binding.
-            value_item (dict): Value object of a binding, e.g. {'type': 'literal', 'value': 'Juana Ines de La Cruz'}
             mapping (dict, optional): Mapping of variable names in the sparql results to key in the data item.
                 e.g. { "Agent" : {"key": "authorUri", "datatype" : "str" }, "Name" : {"key" : "authorName" ...} }
-                All mappings are passed through. Need to select the mapping relevant for the
-                current variable.
+
+        Returns:
+            list: Tuples (variable, key, converter) in the order of the variables in the head. The converter is a
+                function that takes a value object of a binding, e.g. {'type': 'literal', 'value': 'Juana'}, and
+                returns the value.
+        """
+        converters = []
+
+        for var in self.vars:
+            key = var
+            converter = self.__convert_value
+
+            if mapping and var in mapping:
+                # use either the default var as key or if a mapping is available use this
+                if "key" in mapping[var] and mapping[var]["key"]:
+                    key = mapping[var]["key"]
+
+                if "datatype" in mapping[var]:
+                    datatype = mapping[var]["datatype"]
+                    if datatype in self.datatype_converters:
+                        convert = self.datatype_converters[datatype]
+                        converter = lambda value_item, convert=convert: convert(value_item["value"])
+                    else:
+                        raise Exception("Mapping for datatype " + datatype + "is not available.")
+
+            converters.append((var, key, converter))
+
+        return converters
+
+    def __convert_value(self, value_item: dict):
+        """Get the value of a value object of a binding without an explicit mapping.
+
+        Args:
+            value_item (dict): Value object of a binding, e.g. {'type': 'literal', 'value': 'Juana Ines de La Cruz'}
 
         Returns: the value
         """
-        # Look for mappings; an explicit datatype has priority over guessed types
-        has_datatype_mapping = False
-
-        if mapping:
-            # mappings are provided, but need to check, if there is a mapping for the current variable
-            if key in mapping:
-                if "datatype" in mapping[key]:
-                    has_datatype_mapping = True
-                    datatype = mapping[key]["datatype"]
-
-        if has_datatype_mapping is True:
-            if datatype == "str" or datatype == "String":
-                value = str(value_item["value"])
-            elif datatype == "int" or datatype == "Integer":
-                value = int(value_item["value"])
-            else:
-                raise Exception("Mapping for datatype " + datatype + "is not available.")
+        value_type = value_item["type"]
 
-        else:
-            # there is no explicit mapping, evaluate "type" of the value item
-            if value_item["type"] == "uri" or value_item["type"] == "literal":
-                value = str(value_item["value"])
-
-            # there are explicit types defined:
-            elif value_item["type"] == "typed-literal" and "datatype" in value_item:
-                if value_item["datatype"] == "http://www.w3.org/2001/XMLSchema#int":
-                    value = int(value_item["value"])
-                else:
-                    raise Exception("No automatic mapping available for typed-literal of datatype " + value_item["datatype"])
+        if value_type == "uri" or value_type == "literal":
+            return value_item["value"]
 
+        # there are explicit types defined:
+        elif value_type == "typed-literal" and "datatype" in value_item:
+            if value_item["datatype"] in self.xsd_converters:
+                return self.xsd_converters[value_item["datatype"]](value_item["value"])
             else:
-                raise Exception("Mapping for value type " + value_item["type"] + " is not available.")
+                raise Exception("No automatic mapping available for typed-literal of datatype " +
+                                value_item["datatype"])
 
-        return value
+        else:
+            raise Exception("Mapping for value type " + value_type + " is not available.")
 
     def simplify(self, mapping: dict = None) -> list:
         """Get simple representation.
@@ -658,41 +1708,37 @@ class SparqlResults:
             list: List of items.
 
         """
-        # a list for the results to be returned
-        simple_results = []
+        return list(self.iter_simplify(mapping=mapping))
+
+    def iter_simplify(self, mapping: dict = None):
+        """Get simple representation item by item.
+
+        Generator version of simplify(): the items are created while iterating the bindings. Used with
+        streamed results (see DB.sparql()), only a single binding and item are kept in memory.
+
+        Args:
+            mapping (dict, optional): Mapping of variable names in the sparql results to key in the data item.
+                See simplify().
+
+        Yields:
+            A value (if there is only one variable) or a dictionary (data item).
+        """
+        # evaluate the mapping once, not for every value
+        converters = self.compile_mapping(mapping)
 
-        if len(self.vars) == 1:
+        if len(converters) == 1:
             # there is only one value per binding, therefore the sparql results are transformed
             # to a list containing values, e.g. ["value1", "value2"]
+            var, key, convert = converters[0]
 
             for binding in self.bindings:
-                # because there is only one variable, we can use the first element as key here
-                value = self.__get_solution_variable_value(self.vars[0], binding[self.vars[0]], mapping=mapping)
-                simple_results.append(value)
+                # solutions in which the variable is unbound (e.g. OPTIONAL) are skipped
+                value_item = binding.get(var)
+                if value_item is not None:
+                    yield convert(value_item)
 
         else:
             # there are multiple key-value pairs per data_item there the sparql results are transformed
-            # into a list with dictionaries [{},{}]
-
+            # into a list with dictionaries [{},{}]; unbound variables (e.g. OPTIONAL) are not included
             for binding in self.bindings:
-
-                data_item = {}
-                for var in self.vars:
-                    value = self.__get_solution_variable_value(var, binding[var], mapping=mapping)
-
-                    key = None
-
-                    # use either the default var as key or if a mapping is available use this
-                    if mapping:
-                        if var in mapping:
-                            if "key" in mapping[var]:
-                                key = mapping[var]["key"]
-
-                    if key:
-                        data_item[key] = value
-                    else:
-                        data_item[var] = value
-
-                simple_results.append(data_item)
-
-        return simple_results
+                yield {key: convert(binding[var]) for var, key, convert in converters if var in binding}
@@ -58,6 +58,43 @@ class GolemQuery(SparqlQuery):
         }
     ]
 
+    # Namespace of the GOLEM data (prefix "gd"); URIs in this namespace are stored without it, see compact_uri()
+    data_namespace = "http://data.golemlab.eu/data/"
+
+    @staticmethod
+    def compact_uri(uri: str) -> str:
+        """Get a compact representation of an URI to keep in memory.
+
+        URIs in the namespace of the GOLEM data are reduced to the local part, e.g. "C000000001". Other URIs (and
+        local parts that contain a colon) are returned as they are.
+
+        Args:
+            uri (str): URI.
+
+        Returns:
+            str: Compact URI. Use expand_uri() to get the URI.
+        """
+        if uri is not None and uri.startswith(GolemQuery.data_namespace):
+            local_part = uri[len(GolemQuery.data_namespace):]
+            # a local part with a colon could not be told apart from an URI
+            if ":" not in local_part:
+                return local_part
+        return uri
+
+    @staticmethod
+    def expand_uri(compact_uri: str) -> str:
+        """Get the URI from a compact representation (see compact_uri()).
+
+        Args:
+            compact_uri (str): Compact URI.
+
+        Returns:
+            str: URI.
+        """
+        if compact_uri is None or ":" in compact_uri:
+            return compact_uri
+        return GolemQuery.data_namespace + compact_uri
+
 
 class CorporaUris(GolemQuery):
     """SPARQL Query: URIs of all Corpora"""
@@ -115,6 +152,58 @@ class CorporaUrisIds(GolemQuery):
     """
 
 
+class CorporaMetadata(GolemQuery):
+    """SPARQL Query: All metadata of all Corpora"""
+
+    label = "Metadata of Corpora"
+
+    description = """
+    Get URIs and all metadata (id, name, acronym, description, licence and metrics) of all corpora (cls:X1_Corpus)
+    in the Knowledge Graph in a single query. Returns one solution per corpus and metric (dimension); the other
+    fields are repeated in each solution. Fields that are not in the Knowledge Graph are unbound.
+    """
+
+    query = """
+    SELECT ?corpus_uri ?id ?name ?acronym ?description ?licenceName ?licenceUri ?dimensionURI ?value WHERE {
+        ?corpus_uri a cls:X1_Corpus .
+
+        OPTIONAL {
+            ?corpus_uri crm:P1_is_identified_by ?idNode .
+            ?idNode crm:P2_has_type gt:id ;
+                rdf:value ?id .
+        }
+
+        OPTIONAL {
+            ?corpus_uri crm:P1_is_identified_by ?nameNode .
+            ?nameNode crm:P2_has_type gt:corpus_name ;
+                rdf:value ?name .
+        }
+
+        OPTIONAL {
+            ?corpus_uri crm:P1_is_identified_by ?acronymNode .
+            ?acronymNode crm:P2_has_type gt:corpus_acronym ;
+                rdf:value ?acronym .
+        }
+
+        OPTIONAL {
+            ?corpus_uri crm:P3_has_note ?description .
+        }
+
+        OPTIONAL {
+            ?corpus_uri crm:P104_is_subject_to ?licence .
+            ?licence a crm:E30_Right ;
+                crm:P3_has_note ?licenceName ;
+                crm:P67_refers_to ?licenceUri .
+        }
+
+        OPTIONAL {
+            ?corpus_uri crm:P43_has_dimension ?dimensionURI .
+            ?dimensionURI crm:P90_has_value ?value .
+        }
+    }
+    """
+
+
 class CorpusName(GolemQuery):
     """SPARQL Query: Name by CorpusURI"""
 
@@ -310,6 +399,66 @@ class CorpusMetrics(GolemQuery):
     ]
 
 
+class CorpusMetadata(GolemQuery):
+    """SPARQL Query: All metadata of a single Corpus"""
+
+    label = "Corpus Metadata"
+
+    description = """
+    Get all metadata (id, name, acronym, description, licence and metrics) of a corpus identified by URI
+    in a single query. Returns one solution per metric (dimension); the other fields are repeated in each solution.
+    Fields that are not in the Knowledge Graph are unbound.
+    """
+
+    template = """
+    SELECT ?id ?name ?acronym ?description ?licenceName ?licenceUri ?dimensionURI ?value WHERE {
+        <$1> a cls:X1_Corpus .
+
+        OPTIONAL {
+            <$1> crm:P1_is_identified_by ?idNode .
+            ?idNode crm:P2_has_type gt:id ;
+                rdf:value ?id .
+        }
+
+        OPTIONAL {
+            <$1> crm:P1_is_identified_by ?nameNode .
+            ?nameNode crm:P2_has_type gt:corpus_name ;
+                rdf:value ?name .
+        }
+
+        OPTIONAL {
+            <$1> crm:P1_is_identified_by ?acronymNode .
+            ?acronymNode crm:P2_has_type gt:corpus_acronym ;
+                rdf:value ?acronym .
+        }
+
+        OPTIONAL {
+            <$1> crm:P3_has_note ?description .
+        }
+
+        OPTIONAL {
+            <$1> crm:P104_is_subject_to ?licence .
+            ?licence a crm:E30_Right ;
+                crm:P3_has_note ?licenceName ;
+                crm:P67_refers_to ?licenceUri .
+        }
+
+        OPTIONAL {
+            <$1> crm:P43_has_dimension ?dimensionURI .
+            ?dimensionURI crm:P90_has_value ?value .
+        }
+    }
+    """
+
+    variables = [
+        {
+            "id": "corpus_uri",
+            "class": "cls:X1_Corpus",
+            "description": "URI of a Corpus."
+        }
+    ]
+
+
 class CorpusCharacterConceptUris(GolemQuery):
     """SPARQL Query: URIs of Character in a Corpus"""
 
@@ -430,3 +579,185 @@ class CorpusCharactersUriIdName(GolemQuery):
     ]
 
 
+
+
+class CorpusCharactersUriIdNamePage(GolemQuery):
+    """SPARQL Query: Get a page of character URI, ID and Name for a corpus"""
+
+    label = "Page of character data (uri, id, name) of corpus"
+
+    description = """
+    Get a page of the character data (uri, id, optionally name) of a single corpus. The characters are ordered by
+    ID and URI. The page starts after the character with the ID and URI given as string literals in $2 and $3
+    (keyset pagination; use empty strings for the first page) and is limited to $4 characters after skipping $5.
+    There is one solution per character (and ID): of multiple names, the first in lexical order is returned, so
+    that the limit counts characters and a page never ends between the names of a character.
+    """
+
+    template = """
+    SELECT ?character AS ?uri ?id (MIN(?name) AS ?name) WHERE {
+        ?character a go:C1_Character_Concept ;
+        crm:P148i_is_component_of <$1> ;
+        crm:P1_is_identified_by ?identifier.
+
+        ?identifier crm:P2_has_type gt:id;
+            rdf:value ?id .
+
+        OPTIONAL {
+            ?character crm:P1_is_identified_by ?appellation .
+
+            ?appellation a crm:E41_Appellation;
+                crm:P2_has_type gt:character_name;
+                rdf:value ?name.
+        }
+
+        FILTER (STR(?id) > $2 || (STR(?id) = $2 && STR(?character) > $3))
+    }
+    GROUP BY ?character ?id
+    ORDER BY STR(?id) STR(?character)
+    LIMIT $4
+    OFFSET $5
+    """
+
+    variables = [
+        {
+            "id": "corpus_uri",
+            "class": "cls:X1_Corpus",
+            "description": "URI of a Corpus."
+        },
+        {
+            "id": "after_id",
+            "class": "xsd:string",
+            "description": "ID of the last character of the previous page as string literal."
+        },
+        {
+            "id": "after_uri",
+            "class": "xsd:string",
+            "description": "URI of the last character of the previous page as string literal."
+        },
+        {
+            "id": "limit",
+            "class": "xsd:integer",
+            "description": "Maximum number of characters."
+        },
+        {
+            "id": "offset",
+            "class": "xsd:integer",
+            "description": "Number of characters to skip."
+        }
+    ]
+
+
+class CorpusCharactersCount(GolemQuery):
+    """SPARQL Query: Number of characters with an ID in a corpus"""
+
+    label = "Number of characters of corpus"
+
+    description = """
+    Get the number of characters (with an ID) of a single corpus, e.g. the total of the paginated characters. A
+    character with multiple IDs is counted once per ID, like in the pages (see CorpusCharactersUriIdNamePage)."""
+
+    template = """
+    SELECT (COUNT(*) AS ?count) WHERE {
+        SELECT DISTINCT ?character ?id WHERE {
+            ?character a go:C1_Character_Concept ;
+            crm:P148i_is_component_of <$1> ;
+            crm:P1_is_identified_by ?identifier.
+
+            ?identifier crm:P2_has_type gt:id;
+                rdf:value ?id .
+        }
+    }
+    """
+
+    variables = [
+        {
+            "id": "corpus_uri",
+            "class": "cls:X1_Corpus",
+            "description": "URI of a Corpus."
+        }
+    ]
+
+
+class CorpusCharactersMetadata(GolemQuery):
+    """SPARQL Query: Get all metadata of the characters of a corpus"""
+
+    label = "Character metadata of corpus"
+
+    description = """
+    Get the metadata (uri, id, name, type, gender, wikidata id, source, years and number of documents) of all
+    characters of a single corpus in a single query. Fields that are not in the Knowledge Graph are unbound.
+    A character can be returned in multiple solutions, e.g. if it has multiple names; the solutions need to be merged.
+    """
+
+    template = """
+    SELECT ?uri ?id ?name ?typeUri ?genderUri ?wikidataId ?sourceName ?sourceUrl ?createdYear ?firstFanficYear
+        ?numDocuments WHERE {
+        ?uri a go:C1_Character_Concept ;
+            crm:P148i_is_component_of <$1> .
+
+        OPTIONAL {
+            ?uri crm:P1_is_identified_by ?identifier .
+            ?identifier crm:P2_has_type gt:id ;
+                rdf:value ?id .
+        }
+
+        OPTIONAL {
+            ?uri crm:P1_is_identified_by ?appellation .
+            ?appellation a crm:E41_Appellation ;
+                crm:P2_has_type gt:character_name ;
+                rdf:value ?name .
+        }
+
+        OPTIONAL {
+            ?uri crm:P2_has_type ?typeUri .
+            FILTER (?typeUri IN (gt:canon_character, gt:fanon_character, gt:canonical_character,
+                gt:derivative_character))
+        }
+
+        OPTIONAL {
+            ?uri crm:P2_has_type ?genderUri .
+            FILTER (STRSTARTS(STR(?genderUri), "http://data.golemlab.eu/data/entity/type/gender/"))
+        }
+
+        OPTIONAL {
+            ?uri crm:P1_is_identified_by ?wikidataNode .
+            ?wikidataNode crm:P2_has_type gt:wikidata ;
+                rdf:value ?wikidataId .
+        }
+
+        OPTIONAL {
+            ?uri crm:P129i_is_subject_of ?source .
+            OPTIONAL { ?source rdfs:label ?sourceName . }
+            OPTIONAL { ?source crm:P67i_is_referred_to_by ?sourceUrl . }
+        }
+
+        OPTIONAL {
+            ?uri crm:P94i_was_created_by|lrm:R16i_was_created_by ?creation .
+            ?creation crm:P4_has_time-span ?createdTimeSpan .
+            ?createdTimeSpan rdf:value ?createdYear .
+        }
+
+        OPTIONAL {
+            SELECT ?uri (MIN(?fanficYear) AS ?firstFanficYear) WHERE {
+                ?uri crm:P16i_was_used_for ?fanficCreation .
+                ?fanficCreation crm:P4_has_time-span ?fanficTimeSpan .
+                ?fanficTimeSpan rdf:value ?fanficYear .
+            } GROUP BY ?uri
+        }
+
+        OPTIONAL {
+            ?uri crm:P43_has_dimension ?documentsDimension .
+            ?documentsDimension crm:P90_has_value ?numDocuments .
+            FILTER (STRENDS(STR(?documentsDimension), "number_of_documents"))
+        }
+    }
+    """
+
+    variables = [
+        {
+            "id": "corpus_uri",
+            "class": "cls:X1_Corpus",
+            "description": "URI of a Corpus."
+        }
+    ]
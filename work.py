@@ -17,51 +17,8 @@ class Work:
         refs (list): Identifiers in external reference ressources
         corpus_ids (list): IDs of the parent corpus
     """
-    # Database connection
-    database = None
-
-    uri = None
-
-    id = None
-
-    title = None
-
-    characters = None
-    """
-    [
-    {
-        "id": "character_id",
-        "uri" : "character_uri",
-        "effect": "created",
-        "data" : Character()
-    }
-    ]
-    """
-
-    authors = None
-    """
-    [
-    {
-        "id": "author_id",
-        "uri": "author_uri",
-        "data" : Author()
-    }
-    ]
-    """
-
-    dates = None
-    """
-    {
-    "created": 1997
-    }
-    """
-
-    refs = None
-    """
-        [{"ref": "QXXXXX", "type": "wikidata"}]
-        """
-
-    corpus_ids = None
+    # Attributes are stored in slots instead of a dictionary per instance
+    __slots__ = ("database", "_uri", "id", "title", "characters", "authors", "dates", "refs", "corpus_ids")
 
     def __init__(self,
                  database: DB = None,
@@ -87,6 +44,21 @@ class Work:
             refs (list): IDs in external reference ressources
             corpus_ids (list): IDs of the corpora the character is contained in
         """
+        # the attributes are slots without class-level defaults: initialize all of them
+        self.database = None
+        self._uri = None
+        self.id = None
+        self.title = None
+        # Characters: [{"id": "character_id", "uri" : "character_uri", "effect": "created", "data" : Character()}]
+        self.characters = None
+        # Authors: [{"id": "author_id", "uri": "author_uri", "data" : Author()}]
+        self.authors = None
+        # Dates: {"created": 1997}
+        self.dates = None
+        # References: [{"ref": "QXXXXX", "type": "wikidata"}]
+        self.refs = None
+        self.corpus_ids = None
+
         if database:
             self.database = database
 
@@ -121,6 +93,15 @@ class Work:
         if corpus_ids:
             self.corpus_ids = corpus_ids
 
+    @property
+    def uri(self) -> str:
+        """URI of the work. Stored in a compact form, see GolemQuery.compact_uri()."""
+        return GolemQuery.expand_uri(self._uri)
+
+    @uri.setter
+    def uri(self, uri: str):
+        self._uri = GolemQuery.compact_uri(uri)
+
     def generate_graph(self) -> Graph:
         """Generate graph data of work.
 